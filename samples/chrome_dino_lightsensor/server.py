@@ -1,10 +1,19 @@
 import asyncio
+import logging
 import websockets
 import socket
-import json
+import sys
+import time
+from pathlib import Path
 import pygame
 import random
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.detectors import EventDetector
+from common.gameloop import FrameLoop, LatencyStats, Mailbox
+from common.parsing import ParseError, parse_scalar
+from common.sampled_log import PayloadLog, setup_logging
+
 def get_ip():
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
@@ -41,9 +50,9 @@ class DinoGame:
         self.game_over = False
         self.game_started = False
 
-        self.light_levels = []
-        self.max_light_history = 10
-        self.change_threshold = 5.0  # Adjusted for illuminance values
+        # Jump when the light level moves away from its recent average (a hand
+        # over the sensor), with hysteresis and debounce so one wave is one jump.
+        self.jump_detector = EventDetector.named('dino_jump')
 
     def create_obstacle(self):
         obstacle = pygame.Rect(self.width, self.height - 60, 30, 60)
@@ -71,7 +80,6 @@ class DinoGame:
         self.score = 0
         self.game_over = False
         self.game_started = False
-        self.light_levels.clear()
 
     def update(self):
         if not self.game_over and self.game_started:
@@ -117,22 +125,17 @@ class DinoGame:
 
         pygame.display.flip()
 
-    def control_dino(self, illuminance):
-        self.light_levels.append(illuminance)
-        if len(self.light_levels) > self.max_light_history:
-            self.light_levels.pop(0)
-
-        if len(self.light_levels) < 2:
-            return
-
-        recent_change = abs(self.light_levels[-1] - self.light_levels[-2])
+    def jump_detected(self, timestamp, illuminance):
+        # Called for every reading; True when the light level change is a gesture.
+        return self.jump_detector.update(timestamp, illuminance) is not None
 
+    def control_dino(self):
+        # Called once per frame in which a gesture was detected.
         if not self.game_started:
-            if recent_change > self.change_threshold:
-                self.game_started = True
-        
+            self.game_started = True
+
         if not self.game_over and self.game_started:
-            if recent_change > self.change_threshold and self.dino_rect.bottom >= self.height - 40:
+            if self.dino_rect.bottom >= self.height - 40:
                 self.dino_velocity = self.jump_strength
 
 class LightSensorServer:
@@ -141,40 +144,54 @@ class LightSensorServer:
         self.ip_addr = get_ip()
         self.port = 8989
         self.game = DinoGame()
+        self.payload_log = PayloadLog(logging.getLogger('chrome_dino'))
+        # Set when a gesture was detected since the last frame.
+        self.mailbox = Mailbox()
+        self.frame_loop = FrameLoop()
+        self.latency = LatencyStats()
 
     async def handle_light_sensor(self, websocket, path):
         print(f"New connection from {websocket.remote_address}")
         try:
             async for message in websocket:
                 try:
-                    data = json.loads(message)
-                    print(f"Received light sensor data: {data}")
+                    timestamp, illuminance = parse_scalar(message, 'illuminance')
+                    self.payload_log.message('/lightsensor', f"t={timestamp} illuminance={illuminance}", len(message))
                     
-                    illuminance = float(data.get('illuminance', 0))
-                    self.game.control_dino(illuminance)
+                    if self.game.jump_detected(timestamp, illuminance):
+                        self.mailbox.put(True)  # applied on the next frame
                     
-                except json.JSONDecodeError:
+                except ParseError:
                     print(f"Error parsing JSON data: {message}")
         except websockets.exceptions.ConnectionClosed:
             print(f"Connection closed for {websocket.remote_address}")
 
-    async def run_game(self):
-        clock = pygame.time.Clock()
-        while True:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    return
-                if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                    if self.game.game_over:
-                        self.game.reset_game()
-
+    def frame(self, steps):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                return False
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+                if self.game.game_over:
+                    self.game.reset_game()
+
+        control = self.mailbox.take()
+        if control is not None:
+            self.game.control_dino()
+        for _ in range(steps):
             self.game.update()
-            self.game.draw()
-            clock.tick(60)
-            await asyncio.sleep(0)
+        self.game.draw()
+        if control is not None:
+            self.latency.observe(time.perf_counter() - control[1])
+        return True
+
+    async def run_game(self):
+        # Fixed 60 Hz timestep that awaits between frames instead of
+        # blocking in clock.tick(), so sensor messages are handled as they arrive.
+        await self.frame_loop.run(self.frame)
 
     async def main(self):
+        setup_logging()
         print(f"Your Computer Name is: {self.hostname}")
         print(f"Your Computer IP Address is: {self.ip_addr}")
         print(f"* Enter {self.ip_addr}:{self.port} in the app.")
@@ -189,8 +206,12 @@ class LightSensorServer:
             max_size=1_000_000_000
         )
         game_task = asyncio.create_task(self.run_game())
+        self.payload_log.add_summary_source(self.latency.summary)
+        self.payload_log.add_summary_source(lambda: f"frames {self.frame_loop.frames} late {self.frame_loop.late_frames}")
+        summary_task = asyncio.create_task(self.payload_log.run_summaries())
 
         await asyncio.gather(server.wait_closed(), game_task)
+        summary_task.cancel()
 
 if __name__ == "__main__":
     server = LightSensorServer()
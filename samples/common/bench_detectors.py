@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""Replay sensor traces with labelled gestures through the game input rules:
+the old raw thresholds (flappy: z > 2 in a frame, dino: a change of more than
+5 lux between two readings) against the streaming detectors in
+detectors.py. Reports detection latency from gesture start, misses, false
+triggers per minute and the detector's cost per sample.
+
+The accelerometer background is the recorded trace, interpolated to --rate
+Hz with sensor noise and the odd single-sample knock added; the light
+background is synthetic (drifting indoor light with noise and flicker)
+unless --light-trace gives a recording. Gestures are injected every few
+seconds: a flick pulse on z, or a hand covering the light sensor.
+
+    python bench_detectors.py [path/to/accelerometer.txt] [--light-trace path] [--rate HZ] [--minutes M]
+"""
+import argparse
+import json
+import math
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.detectors import EventDetector
+
+DEFAULT_TRACE = Path(__file__).resolve().parent.parent / 'visualizations' / 'sample_outputs' / 'accelerometer.txt'
+FRAME = 1 / 60  # the games apply at most one jump per frame
+WINDOW = 0.5  # seconds after a gesture starts in which a detection counts
+
+
+def load_trace(path, field):
+    # (seconds, value) pairs from a recorded JSON-lines trace, from time 0.
+    samples = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                data = json.loads(line)
+                samples.append((int(data['Timestamp']) / 1000.0, float(data[field])))
+    start = samples[0][0]
+    return [(t - start, value) for t, value in samples]
+
+
+def resample(samples, rate, duration):
+    # Linear interpolation of `samples` at `rate` Hz, looping to fill `duration`.
+    span = samples[-1][0]
+    out, i = [], 0
+    for n in range(int(duration * rate)):
+        t = n / rate
+        u = t % span
+        i = i if samples[i][0] <= u else 0
+        while samples[i + 1][0] < u:
+            i += 1
+        (t0, v0), (t1, v1) = samples[i], samples[i + 1]
+        out.append((t, v0 + (v1 - v0) * (u - t0) / (t1 - t0)))
+    return out
+
+
+def synthetic_light(rate, duration, rng):
+    level, out = 250.0, []
+    for n in range(int(duration * rate)):
+        level = min(max(level + rng.gauss(0, 2.0 / math.sqrt(rate)), 150.0), 400.0)  # ~2 lux/s drift
+        out.append((n / rate, level))
+    return out
+
+
+def gesture_times(duration, rng, every=3.0):
+    times, t = [], 2.0
+    while t < duration - every:
+        times.append(t)
+        t += every * rng.uniform(0.6, 1.4)
+    return times
+
+
+def accelerometer_replay(background, rng, noise, knocks):
+    gestures = gesture_times(background[-1][0], rng)
+    shapes = [(start, rng.uniform(0.08, 0.16), rng.uniform(2.5, 3.5)) for start in gestures]
+    out, g = [], 0
+    for t, z in background:
+        while g < len(shapes) and t > shapes[g][0] + shapes[g][1]:
+            g += 1
+        if g < len(shapes) and shapes[g][0] <= t:
+            start, width, peak = shapes[g]
+            z += peak * math.sin(math.pi * (t - start) / width)  # half-sine flick
+        z += rng.gauss(0, noise)
+        if rng.random() < knocks:
+            z += rng.uniform(1.5, 2.5)  # knock or glitch, one sample
+        out.append((t, z))
+    return out, gestures
+
+
+def light_replay(background, rng, noise, knocks):
+    gestures = gesture_times(background[-1][0], rng)
+    shapes = [(start, rng.uniform(0.25, 0.45), rng.uniform(0.5, 0.9)) for start in gestures]
+    ramp = 0.06
+    out, g = [], 0
+    for t, lux in background:
+        while g < len(shapes) and t > shapes[g][0] + shapes[g][1] + ramp:
+            g += 1
+        if g < len(shapes) and shapes[g][0] <= t:
+            start, held, depth = shapes[g]
+            cover = min(1.0, (t - start) / ramp, (start + held + ramp - t) / ramp)
+            lux *= 1.0 - depth * max(cover, 0.0)  # hand over the sensor
+        lux += rng.gauss(0, noise)
+        if rng.random() < knocks:
+            lux += rng.choice((-1, 1)) * rng.uniform(5, 9)  # flicker, one sample
+        out.append((t, max(lux, 0.0)))
+    return out, gestures
+
+
+def old_flappy(samples):
+    return [t for t, z in samples if z > 2]
+
+
+def old_dino(samples):
+    return [t for (_, previous), (t, lux) in zip(samples, samples[1:]) if abs(lux - previous) > 5.0]
+
+
+def detector_events(name, samples):
+    detector = EventDetector.named(name)
+    started = time.perf_counter()
+    events = [event for event in (detector.update(t * 1000.0, value) for t, value in samples) if event is not None]
+    return events, (time.perf_counter() - started) / len(samples)
+
+
+def score(events, gestures, duration):
+    # One jump per frame, first event in each gesture's window is the hit.
+    frames = sorted({int(t / FRAME) for t in events})
+    events = [f * FRAME for f in frames]
+    latencies, false, g = [], 0, 0
+    hit = set()
+    for t in events:
+        while g < len(gestures) and t > gestures[g] + WINDOW:
+            g += 1
+        if g < len(gestures) and gestures[g] - FRAME <= t and g not in hit:
+            hit.add(g)
+            latencies.append(max(t - gestures[g], 0.0))
+        else:
+            false += 1
+    return {
+        'p50': statistics.median(latencies) * 1000 if latencies else float('nan'),
+        'p95': sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1000 if latencies else float('nan'),
+        'missed': len(gestures) - len(hit),
+        'false_per_min': false / (duration / 60),
+    }
+
+
+def report(label, result, gestures, cost=None):
+    line = (f"{label:<22} latency p50 {result['p50']:6.1f} ms p95 {result['p95']:6.1f} ms"
+            f"  missed {result['missed']:3d}/{len(gestures)}  false {result['false_per_min']:5.1f}/min")
+    if cost is not None:
+        line += f"  {cost * 1e6:.2f} us/sample"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('trace', nargs='?', default=DEFAULT_TRACE, help='recorded accelerometer trace')
+    parser.add_argument('--light-trace', help='recorded light sensor trace (default: synthetic)')
+    parser.add_argument('--rate', type=float, default=50.0, help='replay sample rate in Hz')
+    parser.add_argument('--minutes', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    duration = args.minutes * 60
+    knocks = 0.2 / args.rate  # a glitch sample every 5 s or so
+
+    z_trace = load_trace(args.trace, 'z')
+    samples, gestures = accelerometer_replay(resample(z_trace, args.rate, duration), rng, 0.15, knocks)
+    print(f"flappy: {len(samples)} samples at {args.rate:g} Hz, {len(gestures)} flicks")
+    report('  old z > 2', score(old_flappy(samples), gestures, duration), gestures)
+    events, cost = detector_events('flappy_jump', samples)
+    report('  flappy_jump', score(events, gestures, duration), gestures, cost)
+
+    if args.light_trace:
+        light = resample(load_trace(args.light_trace, 'illuminance'), args.rate, duration)
+    else:
+        light = synthetic_light(args.rate, duration, rng)
+    samples, gestures = light_replay(light, rng, 1.5, knocks)
+    print(f"dino: {len(samples)} samples at {args.rate:g} Hz, {len(gestures)} hand waves")
+    report('  old change > 5 lux', score(old_dino(samples), gestures, duration), gestures)
+    events, cost = detector_events('dino_jump', samples)
+    report('  dino_jump', score(events, gestures, duration), gestures, cost)
+
+
+if __name__ == '__main__':
+    main()
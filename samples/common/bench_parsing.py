@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""Parse throughput of the shared parser against the old per-sample path
+(json.loads, then float() on each field). First checks that the stdlib json
+fallback parses every message to the same values as the backend in use.
+
+    python bench_parsing.py [path/to/recorded.txt] [--messages N]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common import parsing
+
+DEFAULT_TRACE = Path(__file__).resolve().parent.parent / 'visualizations' / 'sample_outputs' / 'accelerometer.txt'
+
+
+def baseline(messages):
+    for message in messages:
+        data = json.loads(message)
+        float(data.get('x', 0))
+        float(data.get('y', 0))
+        float(data.get('z', 0))
+
+
+def shared_stdlib(messages):
+    for message in messages:
+        parsing.parse_xyz(message, json.loads)
+
+
+def shared_fast(messages):
+    for message in messages:
+        parsing.parse_xyz(message)
+
+
+def check_fallback(messages):
+    for message in set(messages):
+        fallback = parsing.parse_xyz(message, json.loads)
+        if fallback != parsing.parse_xyz(message):
+            raise SystemExit(f"json and {parsing.BACKEND} disagree on {message!r}: {fallback}")
+
+
+def run(name, fn, messages, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(messages)
+        best = min(best, time.perf_counter() - start)
+    rate = len(messages) / best
+    print(f"{name:<28} {rate:>12,.0f} msg/s  {best / len(messages) * 1e6:6.2f} us/msg")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('trace', nargs='?', default=DEFAULT_TRACE)
+    parser.add_argument('--messages', type=int, default=200_000)
+    args = parser.parse_args()
+
+    lines = [line.strip() for line in open(args.trace) if line.strip()]
+    messages = (lines * (args.messages // len(lines) + 1))[:args.messages]
+
+    print(f"{len(messages)} messages from {args.trace}, JSON backend: {parsing.BACKEND}")
+    check_fallback(messages)
+    base = run('json.loads + float()', baseline, messages)
+    run('parse_xyz (stdlib json)', shared_stdlib, messages)
+    fast = run(f'parse_xyz ({parsing.BACKEND})', shared_fast, messages)
+    print(f"speedup: {fast / base:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
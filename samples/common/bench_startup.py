@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Time from launching a sample server to its port accepting connections,
+next to the time it takes just to import the heavy libraries the servers
+load lazily. With --max-seconds, exits non-zero when a server is slower than
+that, so it can guard against heavy imports creeping back in at module level.
+
+    python bench_startup.py [visualizations sound_landscapes ...] [--runs N] [--max-seconds S]
+"""
+import argparse
+import importlib.util
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SAMPLES = Path(__file__).resolve().parent.parent
+SERVERS = ('visualizations', 'sound_landscapes')
+PORT = 8989
+HEAVY = ('numpy', 'matplotlib.pyplot', 'PIL.Image', 'pydub', 'pygame')
+
+
+def time_to_port(sample, timeout=120.0):
+    # Seconds until `sample`'s server accepts a TCP connection on PORT.
+    env = dict(os.environ, SDL_AUDIODRIVER='dummy', SDL_VIDEODRIVER='dummy', PYTHONDONTWRITEBYTECODE='1')
+    with tempfile.TemporaryDirectory() as cwd:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, str(SAMPLES / sample / 'server.py')], cwd=cwd, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while time.perf_counter() - started < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{sample} exited with code {process.returncode}")
+                try:
+                    socket.create_connection(('127.0.0.1', PORT), timeout=0.1).close()
+                    return time.perf_counter() - started
+                except OSError:
+                    time.sleep(0.01)
+            raise RuntimeError(f"{sample} did not open port {PORT} within {timeout:.0f}s")
+        finally:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def time_to_import(statement):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', statement], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('servers', nargs='*', default=SERVERS)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, help='fail if a server takes longer than this to open its port')
+    args = parser.parse_args()
+
+    installed = [name for name in HEAVY if importlib.util.find_spec(name.partition('.')[0])]
+    if installed:
+        statement = 'import ' + ', '.join(installed)
+        heavy = statistics.median(time_to_import(statement) for _ in range(args.runs))
+        print(f"{'import heavy libraries':<32} {heavy:6.2f} s  ({', '.join(installed)})")
+
+    failed = False
+    for sample in args.servers:
+        seconds = statistics.median(time_to_port(sample) for _ in range(args.runs))
+        slow = args.max_seconds is not None and seconds > args.max_seconds
+        failed |= slow
+        print(f"{sample + ' to port ' + str(PORT):<32} {seconds:6.2f} s" + ('  SLOWER THAN --max-seconds' if slow else ''))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# Streaming gesture detection for sensor-controlled input.
+#
+# Every stage keeps a few numbers of state and does O(1) work per sample.
+# Time constants and intervals are in seconds of the phone's own Timestamp
+# (ms), so a replayed trace detects exactly what it detected live, and
+# irregular sample spacing is handled. An EventDetector chains them:
+#
+#   value -> Ewma (smoothing) -> signal -> Hysteresis -> Debounce -> event
+#
+# where the signal is the smoothed level, its rate of change (Derivative), or
+# its deviation from a slow Ewma baseline. Events fire on the rising edge, or
+# with fire='peak' once the signal has peaked and fallen back (later, but
+# with the peak's time and size).
+
+import math
+
+# Detector settings per use. `on`/`off` are in the units of the signal.
+DETECTORS = {
+    # Flappy jump: a flick that pushes accelerometer z above 2 g.
+    'flappy_jump': dict(signal='level', smoothing=0.02, on=2.0, off=1.2, debounce=0.25),
+    # Dino jump: the light level moving 5+ lux away from its recent average
+    # (a hand over the sensor, or a torch).
+    'dino_jump': dict(signal='deviation', smoothing=0.06, baseline=0.5, hold=1.0, on=5.0, off=2.5, debounce=0.4),
+}
+
+
+class Ewma:
+    """Exponentially weighted moving average with time constant `tau` (s).
+
+    The weight of each sample follows from the time since the previous one,
+    so the response doesn't depend on the sample rate. tau=0 passes values
+    through.
+    """
+
+    def __init__(self, tau):
+        self.tau = tau
+        self.value = None
+        self._last = None
+
+    def update(self, t, x):
+        if self.value is None or self.tau <= 0:
+            self.value = x
+        else:
+            dt = max(t - self._last, 0.0)
+            self.value += (1.0 - math.exp(-dt / self.tau)) * (x - self.value)
+        self._last = t
+        return self.value
+
+    def hold(self, t):
+        # Let time pass without a sample, so it isn't weighted in later.
+        self._last = t
+
+
+class Derivative:
+    # Rate of change per second between consecutive samples (0 at first).
+
+    def __init__(self):
+        self._last = None
+
+    def update(self, t, x):
+        last, self._last = self._last, (t, x)
+        if last is None or t <= last[0]:
+            return 0.0
+        return (x - last[1]) / (t - last[0])
+
+
+class Hysteresis:
+    """On above `on`, off again only below `off` (< on).
+
+    `update()` returns True on the sample that switches it on, so a signal
+    hovering around one threshold doesn't chatter.
+    """
+
+    def __init__(self, on, off):
+        if off > on:
+            raise ValueError("off threshold must not be above on threshold")
+        self.on = on
+        self.off = off
+        self.active = False
+
+    def update(self, x):
+        if self.active:
+            if x < self.off:
+                self.active = False
+            return False
+        if x > self.on:
+            self.active = True
+            return True
+        return False
+
+
+class Debounce:
+    # Lets an event through only if `interval` seconds passed since the last one.
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._last = None
+
+    def allow(self, t):
+        if self._last is not None and t - self._last < self.interval:
+            return False
+        self._last = t
+        return True
+
+
+class PeakDetector:
+    """Largest value of each excursion above `on`, reported once the signal
+    drops below `off`: `update()` returns (time, value) of the peak then, else
+    None."""
+
+    def __init__(self, on, off):
+        self.hysteresis = Hysteresis(on, off)
+        self._peak = None
+
+    def update(self, t, x):
+        was_active = self.hysteresis.active
+        self.hysteresis.update(x)
+        if self.hysteresis.active:
+            if self._peak is None or x > self._peak[1]:
+                self._peak = (t, x)
+            return None
+        if was_active:
+            peak, self._peak = self._peak, None
+            return peak
+        return None
+
+
+class EventDetector:
+    """Smoothing, signal, hysteresis and debounce for one input.
+
+    `update(timestamp_ms, value)` returns the event time in seconds (the
+    sample's time, or the peak's with fire='peak') when a gesture is
+    detected, else None. `signal` is 'level' (smoothed value), 'derivative'
+    (its rate of change per second) or 'deviation' (|smoothed - baseline|,
+    where the baseline is an Ewma of the raw value with time constant
+    `baseline`). The baseline is held for up to `hold` seconds while the
+    signal is on, so returning to the old level ends the event, while a
+    lasting change is absorbed and re-arms the detector.
+    """
+
+    def __init__(self, on, off, signal='level', smoothing=0.0, baseline=0.5, hold=0.0, debounce=0.0, fire='edge'):
+        if signal not in ('level', 'derivative', 'deviation'):
+            raise ValueError(f"Unknown signal: {signal}")
+        if fire not in ('edge', 'peak'):
+            raise ValueError(f"Unknown fire mode: {fire}")
+        self.signal = signal
+        self.fire = fire
+        self.smoothing = Ewma(smoothing)
+        self.baseline = Ewma(baseline)
+        self.hold = hold
+        self._active_since = None
+        self.derivative = Derivative()
+        self.hysteresis = Hysteresis(on, off)
+        self.peaks = PeakDetector(on, off)
+        self.debounce = Debounce(debounce)
+        self.events = 0
+
+    @classmethod
+    def named(cls, name, **overrides):
+        return cls(**dict(DETECTORS[name], **overrides))
+
+    def level(self, t, x):
+        smoothed = self.smoothing.update(t, x)
+        if self.signal == 'derivative':
+            return self.derivative.update(t, smoothed)
+        if self.signal == 'deviation':
+            # Against the baseline before this sample, so a step shows up in
+            # full even at slow update intervals.
+            baseline = self.baseline.value
+            return 0.0 if baseline is None else abs(smoothed - baseline)
+        return smoothed
+
+    def follow(self, t, x, active):
+        # Baseline update after the on/off decision, so the sample that
+        # starts an event is held out of it too.
+        if not active:
+            self._active_since = None
+        elif self._active_since is None:
+            self._active_since = t
+        if self._active_since is None or t - self._active_since >= self.hold:
+            self.baseline.update(t, x)
+        else:
+            self.baseline.hold(t)
+
+    def update(self, timestamp, value):
+        t = timestamp / 1000.0
+        level = self.level(t, value)
+        if self.fire == 'peak':
+            peak = self.peaks.update(t, level)
+            event = peak[0] if peak is not None else None
+        else:
+            event = t if self.hysteresis.update(level) else None
+        if self.signal == 'deviation':
+            self.follow(t, value, (self.peaks.hysteresis if self.fire == 'peak' else self.hysteresis).active)
+        if event is None or not self.debounce.allow(event):
+            return None
+        self.events += 1
+        return event
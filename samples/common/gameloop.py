@@ -0,0 +1,96 @@
+# Fixed-timestep game loop that shares the asyncio event loop with ingest.
+#
+# pygame.time.Clock.tick() sleeps the whole thread, so WebSocket messages
+# used to wait for up to a frame and were then handled in a burst. Here the
+# WebSocket handlers only put the latest control value in a Mailbox, and
+# FrameLoop waits for the next frame with asyncio.sleep(), so messages are
+# handled as they arrive and every frame applies whatever is in the mailbox.
+# pygame stays on the main thread, which macOS requires for its display.
+
+import asyncio
+import time
+from collections import deque
+
+FPS = 60
+MAX_CATCH_UP = 5  # fixed updates to run at most in one frame after a stall
+
+
+class Mailbox:
+    """The newest control value for the next frame.
+
+    `put()` replaces the pending value, or merges it with `combine(pending,
+    new)` so a short spike between two frames is not lost (e.g. max).
+    `take()` returns (value, perf_counter time the oldest unconsumed value
+    arrived) and empties the mailbox, or None when nothing arrived. Both run
+    on the event loop thread, so no lock is needed.
+    """
+
+    def __init__(self, combine=None):
+        self.combine = combine
+        self._value = None
+        self._since = None
+        self.received = 0
+
+    def put(self, value):
+        self.received += 1
+        if self._since is None:
+            self._since = time.perf_counter()
+        elif self.combine is not None:
+            value = self.combine(self._value, value)
+        self._value = value
+
+    def take(self):
+        if self._since is None:
+            return None
+        taken = (self._value, self._since)
+        self._value = self._since = None
+        return taken
+
+
+class LatencyStats:
+    # Input-to-frame latency over the last `window` frames that consumed input.
+
+    def __init__(self, window=600):
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, q):
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float('nan')
+
+    def summary(self):
+        return (f"input->frame p50 {self.percentile(0.5) * 1000:.1f} ms "
+                f"p99 {self.percentile(0.99) * 1000:.1f} ms")
+
+
+class FrameLoop:
+    """Calls `frame(steps)` FPS times a second without blocking the loop.
+
+    `steps` is how many fixed 1/FPS updates to simulate this frame: usually 1,
+    more after a stall (capped at MAX_CATCH_UP, the rest is dropped), so game
+    speed doesn't depend on the frame rate. `frame` returns False to stop.
+    """
+
+    def __init__(self, fps=FPS, max_catch_up=MAX_CATCH_UP):
+        self.period = 1.0 / fps
+        self.max_catch_up = max_catch_up
+        self.frames = 0
+        self.late_frames = 0
+
+    async def run(self, frame):
+        next_frame = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            steps = int((now - next_frame) / self.period) + 1
+            if steps > 1:
+                self.late_frames += 1
+            if steps > self.max_catch_up:
+                steps = self.max_catch_up
+                next_frame = now - (steps - 1) * self.period
+            if frame(steps) is False:
+                return
+            self.frames += 1
+            next_frame += steps * self.period
+            await asyncio.sleep(max(0.0, next_frame - time.perf_counter()))
@@ -0,0 +1,50 @@
+# Deferred construction of heavy processing stages.
+#
+# Importing numpy, matplotlib, PIL or pydub takes seconds on a Raspberry Pi.
+# The sample servers build every stage that needs them through a Lazy, so the
+# port is bound straight away: a stage is built on first use, or earlier by
+# warm_up() on a background thread once the server is listening. Modules that
+# import those libraries at the top are only imported inside the factories.
+
+import asyncio
+import logging
+import threading
+import time
+
+log = logging.getLogger('common.lazy')
+
+
+class Lazy:
+    def __init__(self, factory, name=None):
+        self.factory = factory
+        self.name = name or factory.__name__
+        self._value = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._value is not None
+
+    def get(self):
+        # Safe from any thread; a caller that races warm_up() waits for it.
+        value = self._value
+        if value is None:
+            with self._lock:
+                if self._value is None:
+                    started = time.perf_counter()
+                    self._value = self.factory()
+                    log.info('Loaded %s in %.2fs', self.name, time.perf_counter() - started)
+                value = self._value
+        return value
+
+
+async def warm_up(*stages):
+    # Build `stages` one after another on a worker thread, so the first
+    # message that needs one rarely has to wait. Failures are only logged;
+    # first use will raise them again.
+    loop = asyncio.get_running_loop()
+    for stage in stages:
+        try:
+            await loop.run_in_executor(None, stage.get)
+        except Exception as e:
+            log.error('Warm-up of %s failed: %s', stage.name, e)
@@ -0,0 +1,82 @@
+# Shared, schema-aware parsing of Sensor Stream messages.
+#
+# The app sends one JSON object per message, e.g.
+#   {"SensorName":"Accelerometer","Timestamp":1723210602669,"x":"0.388428","y":"0.907227","z":"0.205811"}
+# The helpers below decode that with the fastest JSON library available and
+# hand back typed values (int timestamp, float readings) in one step. orjson
+# and ujson are optional (`pip install orjson` for about 2.5x faster parsing);
+# without them the standard library's json is used.
+
+import json
+
+try:
+    import orjson
+    loads = orjson.loads
+    BACKEND = 'orjson'
+except ImportError:
+    try:
+        import ujson
+        loads = ujson.loads
+        BACKEND = 'ujson'
+    except ImportError:
+        loads = json.loads
+        BACKEND = 'json'
+
+# Fields carried by each sensor, from the data format cheat sheet in the README.
+SENSOR_FIELDS = {
+    'accelerometer': ('x', 'y', 'z'),
+    'gyroscope': ('x', 'y', 'z'),
+    'magnetometer': ('x', 'y', 'z'),
+    'orientation': ('azimuth', 'pitch', 'roll'),
+    'stepcounter': ('steps',),
+    'thermometer': ('temperature',),
+    'lightsensor': ('illuminance',),
+    'proximity': ('isNear', 'value', 'maxRange'),
+}
+
+
+class ParseError(ValueError):
+    pass
+
+
+def parse_message(message, loads=loads):
+    # Decode a message into a dict, for sensors without a fixed schema.
+    try:
+        data = loads(message)
+    except ValueError as e:
+        raise ParseError(f"Invalid JSON: {message!r}") from e
+    if not isinstance(data, dict):
+        raise ParseError(f"Expected a JSON object: {message!r}")
+    return data
+
+
+def parse_xyz(message, loads=loads):
+    # (timestamp, x, y, z) for accelerometer/gyroscope/magnetometer messages.
+    # Kept flat on purpose: this runs once per message on the hot path.
+    try:
+        get = loads(message).get
+        return int(get('Timestamp', 0)), float(get('x', 0)), float(get('y', 0)), float(get('z', 0))
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ParseError(f"Bad reading: {message!r}") from e
+
+
+def parse_scalar(message, field, loads=loads):
+    # (timestamp, value) for single-value sensors such as the light sensor.
+    try:
+        get = loads(message).get
+        return int(get('Timestamp', 0)), float(get(field, 0))
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ParseError(f"Bad reading: {message!r}") from e
+
+
+def parse_reading(sensor, message, loads=loads):
+    # (timestamp, values) with one float per field in SENSOR_FIELDS[sensor].
+    fields = SENSOR_FIELDS[sensor]
+    if fields == ('x', 'y', 'z'):
+        timestamp, x, y, z = parse_xyz(message, loads)
+        return timestamp, (x, y, z)
+    try:
+        get = loads(message).get
+        return int(get('Timestamp', 0)), tuple(float(get(f, 0)) for f in fields)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ParseError(f"Bad reading: {message!r}") from e
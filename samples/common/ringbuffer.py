@@ -0,0 +1,100 @@
+# Fixed-capacity, preallocated history of sensor readings.
+#
+# Readings are kept in typed NumPy arrays (int64 timestamps, one float column
+# per field) instead of lists of tuples/dicts, so appending never allocates and
+# plotting/sound/game code can read the newest N samples as array views.
+
+import numpy as np
+
+from common.parsing import SENSOR_FIELDS
+
+DEFAULT_CAPACITY = 1024
+
+
+class RingBuffer:
+    """The last `capacity` (timestamp, values) readings of one sensor.
+
+    Every reading is stored twice, at slot i and i + capacity, so the newest n
+    readings are always one contiguous slice: `last(n)` returns views, never
+    copies. The views are read-only and are overwritten by later appends, so
+    copy them if they must outlive the next few messages.
+    """
+
+    def __init__(self, fields, capacity=DEFAULT_CAPACITY, dtype=np.float64):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self.count = 0  # readings appended so far, including overwritten ones
+        self._next = 0
+        self._timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self._values = np.zeros((2 * capacity, len(self.fields)), dtype=dtype)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, values):
+        i = self._next
+        j = i + self.capacity
+        self._timestamps[i] = self._timestamps[j] = timestamp
+        self._values[i] = self._values[j] = values
+        self._next = i + 1 if i + 1 < self.capacity else 0
+        self.count += 1
+
+    def extend(self, timestamps, values):
+        # Append many readings at once (values has one row per reading).
+        n = len(timestamps)
+        if n > self.capacity:
+            self.count += n - self.capacity
+            timestamps, values = timestamps[-self.capacity:], values[-self.capacity:]
+            n = self.capacity
+        i = self._next
+        first = min(n, self.capacity - i)
+        for start, rows in ((i, slice(0, first)), (0, slice(first, n))):
+            stop = start + rows.stop - rows.start
+            for mirror in (0, self.capacity):
+                self._timestamps[start + mirror:stop + mirror] = timestamps[rows]
+                self._values[start + mirror:stop + mirror] = values[rows]
+        self._next = (i + n) % self.capacity
+        self.count += n
+
+    def last(self, n=None):
+        # (timestamps, values) of the newest n readings, oldest first;
+        # values has one column per field.
+        n = len(self) if n is None else min(n, len(self))
+        end = self._next + self.capacity
+        timestamps = self._timestamps[end - n:end]
+        values = self._values[end - n:end]
+        timestamps.flags.writeable = False
+        values.flags.writeable = False
+        return timestamps, values
+
+    def column(self, field, n=None):
+        return self.last(n)[1][:, self.fields.index(field)]
+
+    def latest(self):
+        # (timestamp, values) of the newest reading, or None when empty.
+        if not self.count:
+            return None
+        i = self._next - 1 if self._next else self.capacity - 1
+        return int(self._timestamps[i]), tuple(self._values[i].tolist())
+
+    def clear(self):
+        self.count = 0
+        self._next = 0
+
+
+class SensorHistory:
+    """One RingBuffer per sensor with a known schema (see SENSOR_FIELDS)."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, sensors=SENSOR_FIELDS):
+        self.buffers = {sensor: RingBuffer(fields, capacity) for sensor, fields in sensors.items()}
+
+    def __contains__(self, sensor):
+        return sensor in self.buffers
+
+    def __getitem__(self, sensor):
+        return self.buffers[sensor]
+
+    def append(self, sensor, timestamp, values):
+        buffer = self.buffers[sensor]
+        buffer.append(timestamp, values)
+        return buffer
@@ -0,0 +1,15 @@
+# Sampled payload logging for the sample servers. There is one implementation,
+# server/sampled_log.py; this loads it by path (without putting server/ on
+# sys.path, where its modules could shadow the samples' own) and stands in
+# for it. Set common.sampled_log.LOG_EVERY / LOG_INTERVAL before creating a
+# PayloadLog, or pass every= / interval= to it.
+
+import importlib.util
+import sys
+from pathlib import Path
+
+_path = Path(__file__).resolve().parent.parent.parent / 'server' / 'sampled_log.py'
+_spec = importlib.util.spec_from_file_location(__name__, _path)
+_module = importlib.util.module_from_spec(_spec)
+sys.modules[__name__] = _module
+_spec.loader.exec_module(_module)
@@ -0,0 +1,119 @@
+# Streaming spectrogram of PCM audio.
+#
+# Audio arrives from /audio in small base64 chunks of 16-bit PCM. Instead of
+# writing a WAV and re-running a full STFT over the whole recording for every
+# chunk, StreamingSTFT keeps the samples that don't yet fill a window, computes
+# only the new frames with vectorized NumPy, and appends them to a rolling
+# spectrogram of fixed size. Cost per chunk depends only on the chunk size.
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from common.ringbuffer import RingBuffer
+
+N_FFT = 2048
+HOP = 512
+HISTORY = 1024  # spectrogram columns kept (about 11 s at 48 kHz)
+FLOOR_DB = -100.0
+BLOCK_FRAMES = 256  # frames transformed at a time by spectrogram()
+
+
+def frames_db(samples, window, hop, count):
+    # dBFS magnitude spectra of the first `count` frames of `samples`, `hop`
+    # apart: shape (count, bins).
+    frames = sliding_window_view(samples, len(window))[:(count - 1) * hop + 1:hop]
+    # Scale so a full-scale sine peaks at 0 dB.
+    magnitude = np.abs(np.fft.rfft(frames * window, axis=1)) * (2.0 / window.sum())
+    return np.maximum(20 * np.log10(np.maximum(magnitude, 1e-12)), FLOOR_DB).astype(np.float32)
+
+
+class StreamingSTFT:
+    """Incremental magnitude STFT in dBFS, at the audio's own sample rate.
+
+    `feed_pcm(chunk)` takes raw little-endian 16-bit PCM (interleaved when
+    `channels` > 1, mixed down to mono); `feed(samples)` takes floats in
+    [-1, 1]. Both return the new spectrogram columns, shape (frames, bins), and
+    append them to `history`, whose timestamps are the sample index each
+    frame starts at.
+    """
+
+    def __init__(self, sample_rate=48000, n_fft=N_FFT, hop=HOP, history=HISTORY, channels=1):
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop = hop
+        self.channels = channels
+        self.frames = 0
+        self.window = np.hanning(n_fft).astype(np.float32)
+        self.freqs = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+        self.history = RingBuffer(range(len(self.freqs)), capacity=history, dtype=np.float32)
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._carry = b''
+
+    def feed_pcm(self, pcm):
+        frame_bytes = 2 * self.channels
+        if self._carry:
+            pcm = self._carry + pcm
+        usable = len(pcm) - len(pcm) % frame_bytes
+        self._carry = pcm[usable:]
+        samples = np.frombuffer(pcm, dtype='<i2', count=usable // 2).astype(np.float32)
+        samples *= 1.0 / 32768
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        return self.feed(samples)
+
+    def feed(self, samples):
+        buffer = np.concatenate((self._tail, np.asarray(samples, dtype=np.float32)))
+        count = (len(buffer) - self.n_fft) // self.hop + 1 if len(buffer) >= self.n_fft else 0
+        if not count:
+            self._tail = buffer
+            return np.empty((0, len(self.freqs)), dtype=np.float32)
+
+        columns = frames_db(buffer, self.window, self.hop, count)
+        starts = (self.frames + np.arange(count)) * self.hop
+        self.history.extend(starts, columns)
+        self.frames += count
+        # Keep the samples the next frame still needs (its start onwards).
+        self._tail = buffer[count * self.hop:]
+        return columns
+
+    def spectrogram(self):
+        # Rolling spectrogram, shape (bins, frames), oldest frame first.
+        return self.history.last()[1].T
+
+    def duration(self):
+        return self.frames * self.hop / self.sample_rate
+
+
+def spectrogram(samples, sample_rate, n_fft=N_FFT, hop=HOP):
+    # One-shot (bins, frames) dBFS spectrogram of a whole recording, with the
+    # same frames StreamingSTFT would produce. A recording shorter than one
+    # window is zero-padded to a single frame. Frames are transformed a block
+    # at a time straight into the result, so memory stays at the result's size.
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < n_fft:
+        samples = np.pad(samples, (0, n_fft - len(samples)))
+    window = np.hanning(n_fft).astype(np.float32)
+    count = (len(samples) - n_fft) // hop + 1
+    out = np.empty((n_fft // 2 + 1, count), dtype=np.float32)
+    for first in range(0, count, BLOCK_FRAMES):
+        n = min(BLOCK_FRAMES, count - first)
+        block = samples[first * hop:(first + n - 1) * hop + n_fft]
+        out[:, first:first + n] = frames_db(block, window, hop, n).T
+    return out
+
+
+def segment_samples(segment):
+    # Mono float samples in [-1, 1] of a decoded pydub AudioSegment, at its
+    # own sample rate (no resampling).
+    samples = np.array(segment.get_array_of_samples(), dtype=np.float32)
+    samples *= 1.0 / (1 << (8 * segment.sample_width - 1))
+    if segment.channels > 1:
+        samples = samples.reshape(-1, segment.channels).mean(axis=1)
+    return samples
+
+
+def save_spectrogram(db, path, floor=FLOOR_DB):
+    # Write a (bins, frames) dB array straight to an image, low frequencies at
+    # the bottom. No figure, axes or colorbar: cheap enough to do often.
+    from matplotlib.image import imsave
+    imsave(path, db, origin='lower', cmap='magma', vmin=floor, vmax=0)
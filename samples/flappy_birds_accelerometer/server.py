@@ -1,10 +1,19 @@
 import asyncio
+import logging
 import websockets
 import socket
-import json
+import sys
+import time
+from pathlib import Path
 import pygame
 import random
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.detectors import EventDetector
+from common.gameloop import FrameLoop, LatencyStats, Mailbox
+from common.parsing import ParseError, parse_xyz
+from common.sampled_log import PayloadLog, setup_logging
+
 def get_ip():
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
@@ -42,6 +51,10 @@ class FlappyBird:
         self.jump_strength = -7  # Strength of the jump
         self.gravity = 0.4  # Gravity effect
 
+        # A flick (positive z-acceleration, tilting left) jumps: smoothed,
+        # with hysteresis and debounce so one flick is one jump.
+        self.jump_detector = EventDetector.named('flappy_jump')
+
     def create_pipe(self):
         gap = 200
         pipe_height = random.randint(100, self.height - gap - 100)
@@ -117,15 +130,17 @@ class FlappyBird:
 
         pygame.display.flip()
 
-    def control_bird(self, acceleration):
+    def jump_detected(self, timestamp, acceleration):
+        # Called for every z reading; True when it completes a flick.
+        return self.jump_detector.update(timestamp, acceleration) is not None
+
+    def control_bird(self):
+        # Called once per frame in which a flick was detected.
         if not self.game_started:
-            if abs(acceleration) > 1:  # Start the game if there's significant tilt
-                self.game_started = True
-        
+            self.game_started = True
+
         if not self.game_over and self.game_started:
-            # Jump when there's a significant positive z-acceleration (tilting left)
-            if acceleration > 2:  # You can adjust this threshold
-                self.bird_velocity = self.jump_strength
+            self.bird_velocity = self.jump_strength
 
 class AccelerometerServer:
     def __init__(self):
@@ -133,41 +148,55 @@ class AccelerometerServer:
         self.ip_addr = get_ip()
         self.port = 8989
         self.game = FlappyBird()
+        self.payload_log = PayloadLog(logging.getLogger('flappy_birds'))
+        # Set when a flick was detected since the last frame.
+        self.mailbox = Mailbox()
+        self.frame_loop = FrameLoop()
+        self.latency = LatencyStats()
 
     async def handle_accelerometer(self, websocket, path):
         print(f"New connection from {websocket.remote_address}")
         try:
             async for message in websocket:
                 try:
-                    data = json.loads(message)
-                    print(f"Received accelerometer data: {data}")
+                    timestamp, x, y, z = parse_xyz(message)
+                    self.payload_log.message('/accelerometer', f"t={timestamp} x={x} y={y} z={z}", len(message))
                     
-                    # Use 'z' axis for jump control
-                    acceleration = float(data.get('z', 0))
-                    self.game.control_bird(acceleration)
+                    # Use 'z' axis for jump control, applied on the next frame
+                    if self.game.jump_detected(timestamp, z):
+                        self.mailbox.put(True)
                     
-                except json.JSONDecodeError:
+                except ParseError:
                     print(f"Error parsing JSON data: {message}")
         except websockets.exceptions.ConnectionClosed:
             print(f"Connection closed for {websocket.remote_address}")
 
-    async def run_game(self):
-        clock = pygame.time.Clock()
-        while True:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    return
-                if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                    if self.game.game_over:
-                        self.game.reset_game()
-
+    def frame(self, steps):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                return False
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+                if self.game.game_over:
+                    self.game.reset_game()
+
+        control = self.mailbox.take()
+        if control is not None:
+            self.game.control_bird()
+        for _ in range(steps):
             self.game.update()
-            self.game.draw()
-            clock.tick(60)
-            await asyncio.sleep(0)
+        self.game.draw()
+        if control is not None:
+            self.latency.observe(time.perf_counter() - control[1])
+        return True
+
+    async def run_game(self):
+        # Fixed 60 Hz timestep that awaits between frames instead of
+        # blocking in clock.tick(), so sensor messages are handled as they arrive.
+        await self.frame_loop.run(self.frame)
 
     async def main(self):
+        setup_logging()
         print(f"Your Computer Name is: {self.hostname}")
         print(f"Your Computer IP Address is: {self.ip_addr}")
         print(f"* Enter {self.ip_addr}:{self.port} in the app.")
@@ -182,8 +211,12 @@ class AccelerometerServer:
             max_size=1_000_000_000
         )
         game_task = asyncio.create_task(self.run_game())
+        self.payload_log.add_summary_source(self.latency.summary)
+        self.payload_log.add_summary_source(lambda: f"frames {self.frame_loop.frames} late {self.frame_loop.late_frames}")
+        summary_task = asyncio.create_task(self.payload_log.run_summaries())
 
         await asyncio.gather(server.wait_closed(), game_task)
+        summary_task.cancel()
 
 if __name__ == "__main__":
     server = AccelerometerServer()
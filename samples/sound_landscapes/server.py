@@ -6,15 +6,19 @@ import socket
 from base64 import b64decode
 import wave
 import json
-import numpy as np
-import matplotlib.pyplot as plt
-from io import BytesIO
-from PIL import Image
-import librosa
-import librosa.display
-from pydub import AudioSegment
-import os
-import pygame
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.lazy import Lazy, warm_up
+from common.parsing import SENSOR_FIELDS, ParseError, parse_message, parse_reading
+from common.sampled_log import PayloadLog, setup_logging
+
+SPECTROGRAM_EVERY = 1.0  # seconds of /audio between spectrogram updates
+# pygame, numpy, matplotlib and pydub are only imported by the stages built
+# through Lazy, on first use or by a background warm-up once the port is open.
+WARM_UP = True
 
 def get_ip():
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -27,47 +31,48 @@ def get_ip():
         s.close()
     return IP
 
+def make_history():
+    from common.ringbuffer import SensorHistory
+    return SensorHistory(capacity=100)
+
+def load_stft():
+    from common import stft
+    return stft
+
+def load_pyplot():
+    import matplotlib.pyplot as plt
+    return plt
+
+def load_pydub():
+    import pydub
+    return pydub
+
 class SensorSoundLandscape:
     def __init__(self):
-        pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=4096)
-        self.channels = [pygame.mixer.Channel(i) for i in range(3)]
-        self.sounds = [self.create_sine_wave(440), self.create_sine_wave(550), self.create_sine_wave(660)]
-        for channel, sound in zip(self.channels, self.sounds):
-            channel.play(sound, loops=-1)
-            channel.set_volume(0.3)
-
-    def create_sine_wave(self, freq, duration=1.0, volume=0.5):
-        sample_rate = 44100
-        num_samples = int(sample_rate * duration)
-        t = np.linspace(0, duration, num_samples, False)
-        wave = np.sin(2 * np.pi * freq * t) * volume
-        stereo_wave = np.column_stack((wave, wave))  # Create a 2D array
-        sound_array = (stereo_wave * 32767).astype(np.int16)
-        # Ensure the array is C-contiguous
-        sound_array = np.ascontiguousarray(sound_array)
-        sound = pygame.sndarray.make_sound(sound_array)
-        return sound
-
-    def update_sound(self, data):
+        import pygame
+        from synth import BLOCK, SAMPLE_RATE, OscillatorBank, SynthEngine
+        pygame.mixer.init(frequency=SAMPLE_RATE, size=-16, channels=2, buffer=BLOCK)
+        # Three continuous oscillators; sensor readings only steer them.
+        self.oscillators = OscillatorBank([440, 550, 660])
+        self.oscillators.set_targets([440, 550, 660], 1.0)
+        self.engine = SynthEngine(self.oscillators, pygame.mixer.Channel(0))
+        self.engine.start()
+
+    def update_sound(self, x, y, z):
         try:
-            x = float(data.get('x', 0))
-            y = float(data.get('y', 0))
-            z = float(data.get('z', 0))
-            
             freqs = [220 + (x + 1) * 220, 440 + (y + 1) * 220, 660 + (z + 1) * 220]
-            magnitude = np.mean([abs(x), abs(y), abs(z)])
-            amplitude = magnitude * 0.5
-            
-            for i, (channel, freq) in enumerate(zip(self.channels, freqs)):
-                new_sound = self.create_sine_wave(freq)
-                channel.play(new_sound, loops=-1, fade_ms=50)
-                channel.set_volume(amplitude)
+            magnitude = (abs(x) + abs(y) + abs(z)) / 3
+            amplitude = min(magnitude * 0.5, 1.0)
+            self.oscillators.set_targets(freqs, amplitude)
             
-            print(f"Updated sound: f1={freqs[0]:.2f}, f2={freqs[1]:.2f}, f3={freqs[2]:.2f}, amp={amplitude:.2f}")
+            logging.getLogger('sound_landscapes').debug(
+                "Updated sound: f1=%.2f, f2=%.2f, f3=%.2f, amp=%.2f", freqs[0], freqs[1], freqs[2], amplitude)
         except Exception as e:
             print(f"Error updating sound: {e}")
 
     def stop(self):
+        import pygame
+        self.engine.stop()
         pygame.mixer.quit()
 
 class SensorServer:
@@ -75,39 +80,45 @@ class SensorServer:
         self.hostname = socket.gethostname()
         self.ip_addr = get_ip()
         self.port = 8989
-        self.sound_landscape = SensorSoundLandscape()
-        self.sensor_data = {sensor: [] for sensor in ['accelerometer', 'gyroscope', 'magnetometer', 'orientation', 'stepcounter', 'thermometer', 'lightsensor', 'proximity', 'geolocation']}
+        self.sound_landscape = Lazy(SensorSoundLandscape)
+        self.payload_log = PayloadLog(logging.getLogger('sound_landscapes'))
+        self.sensor_data = Lazy(make_history)
+        self.stft = Lazy(load_stft)
+        self.pyplot = Lazy(load_pyplot)
+        self.pydub = Lazy(load_pydub)
 
     async def handle_sensor_data(self, websocket, sensor_type):
         async for message in websocket:
             try:
-                data = json.loads(message)
-                print(f"Received {sensor_type} data: {data}")
-                
-                self.sensor_data[sensor_type].append(data)
-                if len(self.sensor_data[sensor_type]) > 100:
-                    self.sensor_data[sensor_type] = self.sensor_data[sensor_type][-100:]
+                if sensor_type in SENSOR_FIELDS:
+                    data = parse_reading(sensor_type, message)
+                else:
+                    data = parse_message(message)
+                self.payload_log.message(f"/{sensor_type}", data, len(message))
                 
                 with open(f"{sensor_type}.txt", "a") as f:
-                    json.dump(data, f)
+                    f.write(message)
                     f.write("\n")
                 
+                if sensor_type not in SENSOR_FIELDS:
+                    continue
+                history = self.sensor_data.get().append(sensor_type, *data)
+                
                 if sensor_type in ['accelerometer', 'gyroscope', 'magnetometer']:
-                    self.sound_landscape.update_sound(data)
+                    self.sound_landscape.get().update_sound(*history.latest()[1])
                 
-                if len(self.sensor_data[sensor_type]) % 50 == 0:
+                if history.count % 50 == 0:
                     self.generate_visualization(sensor_type)
             
-            except json.JSONDecodeError:
+            except ParseError:
                 print(f"Error parsing JSON data for {sensor_type}: {message}")
 
     def generate_visualization(self, sensor_type):
-        data = self.sensor_data[sensor_type]
+        _, values = self.sensor_data.get()[sensor_type].last()
+        plt = self.pyplot.get()
         plt.figure(figsize=(12, 6))
-        for key in ['x', 'y', 'z']:
-            if key in data[0]:
-                values = [float(d[key]) for d in data]
-                plt.plot(range(len(values)), values, label=key)
+        for i, key in enumerate(SENSOR_FIELDS[sensor_type]):
+            plt.plot(values[:, i], label=key)
         plt.title(f"{sensor_type.capitalize()} Data Visualization")
         plt.xlabel("Time")
         plt.ylabel("Value")
@@ -130,52 +141,68 @@ class SensorServer:
             await websocket.close()
 
     async def handle_audio(self, websocket):
-        data = await websocket.recv()
-        decoded_data = b64decode(data, ' /')
-        with open('temp.pcm', 'wb') as pcm:
-            pcm.write(decoded_data)
-        with open('temp.pcm', 'rb') as pcm:
-            pcmdata = pcm.read()
+        # Streams PCM chunks into audio.wav and a rolling spectrogram. Only the
+        # new STFT frames are computed per chunk; the image is written off the
+        # event loop, skipping updates while the previous one is still running.
+        loop = asyncio.get_running_loop()
+        stft_module = self.stft.get()
+        stft = stft_module.StreamingSTFT(sample_rate=48000)
+        rendered_at = 0.0
+        rendering = None
         with wave.open('audio.wav', 'wb') as wav:
             wav.setnchannels(1)
             wav.setsampwidth(2)
             wav.setframerate(48000)
             wav.setcomptype('NONE', 'NONE')
-            wav.writeframesraw(pcmdata)
-        print("Wrote to audio.wav")
-        self.generate_audio_visualization('audio.wav')
+            async for data in websocket:
+                decoded_data = b64decode(data, ' /')
+                self.payload_log.message('/audio', f"{len(decoded_data)} bytes of PCM", len(data))
+                wav.writeframesraw(decoded_data)
+                stft.feed_pcm(decoded_data)
+                if stft.duration() - rendered_at >= SPECTROGRAM_EVERY and (rendering is None or rendering.done()):
+                    rendered_at = stft.duration()
+                    rendering = loop.run_in_executor(
+                        None, stft_module.save_spectrogram, stft.spectrogram().copy(), 'audio.wav_spectrogram.png')
+        if rendering is not None:
+            await rendering
+        stft_module.save_spectrogram(stft.spectrogram(), 'audio.wav_spectrogram.png')
+        print(f"Wrote {stft.duration():.1f}s of audio to audio.wav")
 
     async def handle_pro_audio(self, websocket):
-        try:
-            data = await websocket.recv()
-            decoded_data = b64decode(data)
-            with open('audio.3gp', 'wb') as gp3:
-                gp3.write(decoded_data)
-            print("Saved 3GP audio file")
-            self.process_3gp_audio('audio.3gp')
-        except Exception as e:
-            print(f"Error processing 3GP audio: {e}")
+        async for data in websocket:
+            try:
+                decoded_data = b64decode(data)
+                with open('audio.3gp', 'wb') as gp3:
+                    gp3.write(decoded_data)
+                print("Saved 3GP audio file")
+                self.process_3gp_audio('audio.3gp')
+            except Exception as e:
+                print(f"Error processing 3GP audio: {e}")
 
     def process_3gp_audio(self, file_path):
-        audio = AudioSegment.from_file(file_path, format="3gp")
+        audio = self.pydub.get().AudioSegment.from_file(file_path, format="3gp")
         wav_path = file_path.replace('.3gp', '.wav')
         audio.export(wav_path, format="wav")
         print(f"Converted 3GP to WAV: {wav_path}")
-        self.generate_audio_visualization(wav_path)
+        self.generate_audio_visualization(wav_path, self.stft.get().segment_samples(audio), audio.frame_rate)
 
-    def generate_audio_visualization(self, audio_path):
-        y, sr = librosa.load(audio_path)
+    def generate_audio_visualization(self, audio_path, y, sr):
+        # y: mono float samples at the recording's own rate sr.
+        import numpy as np
+        plt, stft = self.pyplot.get(), self.stft.get()
         plt.figure(figsize=(12, 8))
-        librosa.display.waveshow(y, sr=sr)
+        plt.plot(np.arange(len(y)) / sr, y, linewidth=0.5)
+        plt.xlabel('Time (s)')
         plt.title('Audio Waveform')
         plt.tight_layout()
         plt.savefig(f"{audio_path}_waveform.png")
         plt.close()
         
-        D = librosa.stft(y)
-        S_db = librosa.amplitude_to_db(np.abs(D), ref=np.max)
+        S_db = stft.spectrogram(y, sr)
         plt.figure(figsize=(12, 8))
-        librosa.display.specshow(S_db, sr=sr, x_axis='time', y_axis='hz')
+        plt.imshow(S_db, origin='lower', aspect='auto', cmap='magma', extent=(0, S_db.shape[1] * stft.HOP / sr, 0, sr / 2))
+        plt.xlabel('Time (s)')
+        plt.ylabel('Hz')
         plt.colorbar(format='%+2.0f dB')
         plt.title('Audio Spectrogram')
         plt.tight_layout()
@@ -191,8 +218,16 @@ class SensorServer:
         print("* Select the sensors to stream.")
         print("* Update the 'update interval' by entering a value in ms.")
 
-        async with websockets.serve(self.router, '0.0.0.0', self.port, max_size=1_000_000_000):
-            await asyncio.Future()  # run forever
+        setup_logging()
+        summary_task = asyncio.create_task(self.payload_log.run_summaries())
+        try:
+            async with websockets.serve(self.router, '0.0.0.0', self.port, max_size=1_000_000_000):
+                if WARM_UP:
+                    asyncio.create_task(warm_up(
+                        self.sensor_data, self.sound_landscape, self.stft, self.pyplot, self.pydub))
+                await asyncio.Future()  # run forever
+        finally:
+            summary_task.cancel()
 
     async def router(self, websocket, path):
         if path in ['/accelerometer', '/gyroscope', '/magnetometer', '/orientation', '/stepcounter', '/thermometer', '/lightsensor', '/proximity', '/geolocation']:
@@ -210,4 +245,5 @@ if __name__ == "__main__":
         asyncio.run(server.main())
     except KeyboardInterrupt:
         print("Shutting down server...")
-        server.sound_landscape.stop()
\ No newline at end of file
+        if server.sound_landscape.loaded:
+            server.sound_landscape.get().stop()
\ No newline at end of file
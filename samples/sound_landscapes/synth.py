@@ -0,0 +1,95 @@
+# Real-time additive synthesis for the sound landscape.
+#
+# A fixed bank of sine oscillators is rendered in small blocks on a background
+# thread and queued on one pygame channel. Sensor messages only move the
+# target frequencies and amplitude; the render loop glides towards them once
+# per block (control rate) and ramps within the block, carrying each
+# oscillator's phase across blocks, so parameter changes never click.
+
+import math
+import threading
+
+import numpy as np
+import pygame
+
+SAMPLE_RATE = 44100
+BLOCK = 1024  # frames per rendered block (~23 ms)
+SMOOTHING = 0.05  # seconds for parameters to cover ~63% of a change
+VOICE_GAIN = 0.3
+
+
+class OscillatorBank:
+    def __init__(self, freqs, sample_rate=SAMPLE_RATE, smoothing=SMOOTHING):
+        self.sample_rate = sample_rate
+        self.smoothing = smoothing
+        self.freqs = np.array(freqs, dtype=np.float64)
+        self.amplitude = 0.0
+        self._phase = np.zeros(len(self.freqs))
+        self._target_freqs = self.freqs.copy()
+        self._target_amplitude = 0.0
+
+    def set_targets(self, freqs, amplitude):
+        # Cheap and safe to call from any thread at any rate; only the values
+        # current when the next block starts are used.
+        self._target_freqs = np.array(freqs, dtype=np.float64)
+        self._target_amplitude = float(amplitude)
+
+    def render(self, frames=BLOCK):
+        # One mono block of float32 samples in [-1, 1].
+        alpha = 1.0 - math.exp(-frames / (self.smoothing * self.sample_rate))
+        freqs = self.freqs + alpha * (self._target_freqs - self.freqs)
+        amplitude = self.amplitude + alpha * (self._target_amplitude - self.amplitude)
+
+        ramp = np.arange(1, frames + 1) / frames
+        # Per-sample frequency glides linearly from the old to the new value.
+        steps = (self.freqs[:, None] + (freqs - self.freqs)[:, None] * ramp) * (2 * np.pi / self.sample_rate)
+        phases = self._phase[:, None] + np.cumsum(steps, axis=1)
+        gain = (self.amplitude + (amplitude - self.amplitude) * ramp) * VOICE_GAIN
+        block = (np.sin(phases).sum(axis=0) * gain).astype(np.float32)
+
+        self._phase = np.mod(phases[:, -1], 2 * np.pi)
+        self.freqs = freqs
+        self.amplitude = amplitude
+        return np.clip(block, -1.0, 1.0, out=block)
+
+
+class SynthEngine:
+    """Feeds an OscillatorBank to a pygame mixer channel from its own thread.
+
+    One block plays while the next one waits in the channel queue, so the
+    output latency is about two blocks.
+    """
+
+    def __init__(self, bank, channel, block=BLOCK):
+        self.bank = bank
+        self.channel = channel
+        self.block = block
+        self.blocks = 0
+        self.underruns = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='synth', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _sound(self):
+        mono = (self.bank.render(self.block) * 32767).astype(np.int16)
+        self.blocks += 1
+        return pygame.sndarray.make_sound(np.ascontiguousarray(np.column_stack((mono, mono))))
+
+    def _run(self):
+        self.channel.play(self._sound())
+        period = self.block / self.bank.sample_rate
+        while not self._stopped.is_set():
+            if self.channel.get_queue() is None:
+                if not self.channel.get_busy():
+                    self.underruns += 1
+                    self.channel.play(self._sound())
+                else:
+                    self.channel.queue(self._sound())
+            self._stopped.wait(period / 4)
+        self.channel.stop()
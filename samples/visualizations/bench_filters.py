@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""Sepia throughput at common phone camera resolutions: the old float
+np.dot path against the fixed-point filter, and the whole decode -> filter ->
+PNG save pipeline on one thread against FramePool.
+
+    python bench_filters.py [--frames N] [--workers N]
+"""
+import argparse
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from filters import SEPIA, FramePool, filter_frame, sepia
+
+RESOLUTIONS = {
+    '480p': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '12MP': (4032, 3024),
+}
+
+
+def baseline(pixels):
+    return np.dot(pixels, np.array(SEPIA).T).astype(np.uint8)
+
+
+def fixed_point(pixels):
+    return sepia.apply_rgb(pixels)
+
+
+def run(name, fn, frames, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(frames)
+        best = min(best, time.perf_counter() - start)
+    rate = len(frames) / best
+    print(f"  {name:<32} {rate:>8.1f} frames/s  {best / len(frames) * 1000:7.1f} ms/frame")
+    return rate
+
+
+def test_frame(width, height):
+    # Smooth gradients plus noise, so JPEG/PNG sizes resemble a camera frame.
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels += rng.normal(0, 12, pixels.shape)
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = Path(tmp)
+        for label, (width, height) in RESOLUTIONS.items():
+            pixels = test_frame(width, height)
+            print(f"{label} ({width}x{height})")
+            base = run('np.dot float64 (old)', lambda frames: [baseline(p) for p in frames], [pixels] * args.frames)
+            fast = run('uint8/uint16 fixed point', lambda frames: [fixed_point(p) for p in frames], [pixels] * args.frames)
+            print(f"  filter speedup: {fast / base:.1f}x")
+
+            encoded = BytesIO()
+            Image.fromarray(pixels).save(encoded, format='JPEG', quality=90)
+            frames = [(encoded.getvalue(), out / f"{label}_{i}.png") for i in range(args.frames)]
+            run('decode+filter+save, 1 thread', lambda frames: [filter_frame(*frame) for frame in frames], frames)
+            pool = FramePool(workers=args.workers)
+            run(f'decode+filter+save, {args.workers} workers', pool.map, frames)
+            pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+# Integer image filters for /camera frames.
+#
+# A 3x3 colour matrix such as sepia is applied in 7-bit fixed point: each
+# output channel is the sum of three uint8 x uint16 products, shifted and
+# clipped to 255. Nothing is promoted to float, the planar, intermediate and
+# output arrays are reused per thread and frame size, grayscale frames go
+# through per-channel lookup tables and palette frames only have their palette
+# filtered. FramePool runs decode -> filter -> save for batches of frames on a
+# thread pool, behind a bounded queue.
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+SEPIA = (
+    (0.393, 0.769, 0.189),
+    (0.349, 0.686, 0.168),
+    (0.272, 0.534, 0.131),
+)
+SHIFT = 7  # fixed-point fraction bits; limits matrix row sums to about 2.0 (see below)
+WORKERS = 2
+BATCH = 4  # frames handed to a worker at once
+QUEUE_SIZE = 8  # frames waiting for a worker; more are dropped
+DROP_OLDEST = 'oldest'
+DROP_NEWEST = 'newest'
+
+log = logging.getLogger('visualizations.filters')
+
+
+class ColorMatrixFilter:
+    def __init__(self, matrix=SEPIA):
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if (matrix < 0).any():
+            raise ValueError("Only non-negative colour matrices are supported")
+        fixed = np.rint(matrix * (1 << SHIFT)).astype(np.int64)
+        # The uint16 accumulator holds row_sum * 255 * 2**SHIFT plus the
+        # rounding term; anything larger would wrap silently.
+        limit = np.iinfo(np.uint16).max - (1 << (SHIFT - 1))
+        if (fixed.sum(axis=1) * 255 > limit).any():
+            raise ValueError(f"Colour matrix rows must sum to at most {limit / 255 / (1 << SHIFT):.3f}")
+        self.coefficients = [[np.uint16(c) for c in row] for row in fixed]
+        # Grayscale input has r == g == b, so each output is one table lookup.
+        self.gray_lut = np.minimum(np.rint(matrix.sum(axis=1)[:, None] * np.arange(256)), 255).astype(np.uint8)
+        self._local = threading.local()
+
+    def _buffers(self, shape):
+        # (planar input, accumulator, scratch, output) for this thread, reused
+        # while the frame size stays the same.
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None or buffers[1].shape != shape:
+            buffers = self._local.buffers = (
+                np.empty((3,) + shape, dtype=np.uint8),
+                np.empty(shape, dtype=np.uint16),
+                np.empty(shape, dtype=np.uint16),
+                np.empty(shape + (3,), dtype=np.uint8),
+            )
+        return buffers
+
+    def apply_rgb(self, rgb):
+        # (H, W, 3+) uint8 array -> (H, W, 3) uint8, in a reused buffer that
+        # is overwritten by this thread's next call.
+        planar, acc, scratch, out = self._buffers(rgb.shape[:2])
+        # One pass to planar layout makes every product below a contiguous loop.
+        np.copyto(planar, np.moveaxis(rgb[..., :3], -1, 0))
+        for o, row in enumerate(self.coefficients):
+            np.multiply(planar[0], row[0], out=acc, dtype=np.uint16)
+            for i in (1, 2):
+                np.multiply(planar[i], row[i], out=scratch, dtype=np.uint16)
+                np.add(acc, scratch, out=acc)
+            np.add(acc, 1 << (SHIFT - 1), out=acc)  # round to nearest
+            np.right_shift(acc, SHIFT, out=acc)
+            np.minimum(acc, 255, out=acc)
+            out[..., o] = acc
+        return out
+
+    def apply_palette(self, palette):
+        # Flat [r, g, b, r, g, b, ...] palette -> filtered palette, same layout.
+        rgb = np.asarray(palette, dtype=np.uint8).reshape(1, -1, 3)
+        return self.apply_rgb(rgb).tobytes()
+
+    def apply(self, img):
+        # PIL image in -> filtered PIL image out. Alpha is kept; palette
+        # images are filtered through their palette only.
+        if img.mode == 'P' and img.palette is not None and img.palette.mode == 'RGB':
+            filtered = img.copy()
+            filtered.putpalette(self.apply_palette(img.getpalette()))
+            return filtered
+        if img.mode == 'L':
+            gray = np.asarray(img)
+            return Image.fromarray(np.stack([lut[gray] for lut in self.gray_lut], axis=-1))
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        pixels = np.asarray(img)
+        out = self.apply_rgb(pixels)
+        if img.mode == 'RGBA':
+            rgba = np.empty(pixels.shape, dtype=np.uint8)
+            rgba[..., :3] = out
+            rgba[..., 3] = pixels[..., 3]
+            return Image.fromarray(rgba, 'RGBA')
+        return Image.fromarray(out, 'RGB')
+
+
+sepia = ColorMatrixFilter(SEPIA)
+
+
+def filter_frame(data, path, image_filter=sepia):
+    # Decode one encoded frame, filter it and write it to `path`. Blocking.
+    img = Image.open(BytesIO(data))
+    # Fastest zlib level: the PNG encode, not the filter, dominates otherwise.
+    image_filter.apply(img).save(path, compress_level=1)
+    return path
+
+
+class FramePool:
+    """Decodes, filters and saves frames in batches on a thread pool.
+
+    `submit(data, path)` queues a frame and returns immediately. While a
+    worker is idle frames go out one by one; when all workers are busy they
+    are collected and handed over up to `batch` at a time, so a backlog costs
+    one task per batch instead of one per frame. Image decode, PNG encode and
+    most of the arithmetic run in C outside the GIL.
+
+    At most `queue_size` frames wait; when more arrive `submit()` drops the
+    oldest waiting frame (`DROP_OLDEST`) or the incoming one (`DROP_NEWEST`,
+    then returns False), so a stream faster than the workers can't fill up
+    memory.
+    """
+
+    def __init__(self, image_filter=sepia, workers=WORKERS, batch=BATCH, queue_size=QUEUE_SIZE, drop_policy=DROP_OLDEST):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.image_filter = image_filter
+        self.workers = workers
+        self.batch = batch
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._pending = []
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='filters')
+
+    def submit(self, data, path):
+        with self._lock:
+            if len(self._pending) >= self.queue_size:
+                self.dropped += 1
+                if self.drop_policy == DROP_NEWEST:
+                    return False
+                del self._pending[0]
+            self._pending.append((data, path))
+            if self._busy < self.workers:
+                self._dispatch()
+            return True
+
+    def flush(self):
+        with self._lock:
+            self._dispatch()
+
+    def depth(self):
+        return len(self._pending)
+
+    def _dispatch(self):
+        if self._pending:
+            batch, self._pending = self._pending[:self.batch], self._pending[self.batch:]
+            self._busy += 1
+            self._executor.submit(self._run_and_continue, batch)
+
+    def _run_and_continue(self, batch):
+        try:
+            self._run(batch)
+        finally:
+            with self._lock:
+                self._busy -= 1
+                self._dispatch()  # whatever queued up while we were busy
+
+    def map(self, frames):
+        # Filter [(data, path), ...] and wait for all of them; for benchmarks.
+        batches = [frames[i:i + self.batch] for i in range(0, len(frames), self.batch)]
+        for _ in self._executor.map(self._run, batches):
+            pass
+
+    def close(self):
+        # Waits for queued frames; _run_and_continue keeps dispatching them.
+        self.flush()
+        while True:
+            with self._lock:
+                if not self._busy and not self._pending:
+                    break
+            time.sleep(0.01)
+        self._executor.shutdown(wait=True)
+
+    def _run(self, batch):
+        for data, path in batch:
+            try:
+                started = time.perf_counter()
+                filter_frame(data, path, self.image_filter)
+                self.processed += 1
+                log.debug('Filtered %s in %.1f ms', path, (time.perf_counter() - started) * 1000)
+            except Exception as e:
+                self.failed += 1
+                log.error('Error filtering %s: %s', path, e)
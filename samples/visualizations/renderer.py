@@ -0,0 +1,106 @@
+# Plot and spectrogram rendering off the event loop.
+#
+# One background thread owns a persistent matplotlib figure per sensor and only
+# updates its line data for each render, then writes the PNG straight to disk.
+# Requests go through a one-slot-per-sensor mailbox: if rendering falls behind,
+# older windows are replaced by the newest one instead of queueing up.
+
+import logging
+import threading
+import time
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.dates import date2num
+from matplotlib.figure import Figure
+
+from common.stft import save_spectrogram
+
+log = logging.getLogger('visualizations.renderer')
+
+
+class PlotRenderer:
+    # Pending renders are keyed by sensor (or e.g. 'audio'); a new request for
+    # the same key replaces the old one if it hasn't been drawn yet.
+
+    def __init__(self, fields, figsize=(12, 6)):
+        self.fields = fields  # sensor -> field names, one line per field
+        self.figsize = figsize
+        self.rendered = 0
+        self.coalesced = 0
+        self._pending = {}
+        self._plots = {}
+        self._wake = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='renderer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, sensor, timestamps, values, path):
+        # Called from the event loop; copies the window (ring buffer views
+        # change under us) and returns immediately.
+        window = (sensor, np.array(timestamps, dtype='datetime64[ms]'), np.array(values), path)
+        self._post(sensor, self._render, window)
+
+    def submit_spectrogram(self, key, db, path):
+        # `db` is a (bins, frames) array, e.g. StreamingSTFT.spectrogram().
+        self._post(key, save_spectrogram, (np.array(db), path))
+
+    def _post(self, key, draw, args):
+        with self._wake:
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = (draw, args)
+            self._wake.notify()
+
+    def close(self):
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while not self._pending and not self._closed:
+                    self._wake.wait()
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, {}
+            for key, (draw, args) in pending.items():
+                try:
+                    started = time.perf_counter()
+                    draw(*args)
+                    self.rendered += 1
+                    log.debug('Rendered %s in %.1f ms', args[-1], (time.perf_counter() - started) * 1000)
+                except Exception as e:
+                    log.error('Error rendering %s: %s', key, e)
+
+    def _plot(self, sensor):
+        plot = self._plots.get(sensor)
+        if plot is None:
+            figure = Figure(figsize=self.figsize)
+            FigureCanvasAgg(figure)
+            ax = figure.add_subplot()
+            lines = [ax.plot([], [], label=field)[0] for field in self.fields[sensor]]
+            ax.set_title(f"{sensor} Data Visualization")
+            ax.set_xlabel('Timestamp')
+            ax.set_ylabel('Value')
+            ax.xaxis_date()
+            ax.legend()
+            ax.tick_params(axis='x', labelrotation=45)
+            plot = self._plots[sensor] = (figure, ax, lines)
+        return plot
+
+    def _render(self, sensor, timestamps, values, path):
+        first = sensor not in self._plots
+        figure, ax, lines = self._plot(sensor)
+        x = date2num(timestamps)
+        for i, line in enumerate(lines):
+            line.set_data(x, values[:, i])
+        ax.relim()
+        ax.autoscale_view()
+        if first:
+            figure.tight_layout()  # once, with real tick labels to measure
+        figure.savefig(path, format='png')
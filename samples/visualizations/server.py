@@ -3,19 +3,17 @@
 import asyncio
 import websockets
 import socket
+import sys
 from base64 import b64decode
+from pathlib import Path
 import wave
 import json
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from io import BytesIO
-from PIL import Image
-import seaborn as sns
-from scipy.io import wavfile
-import librosa
-import librosa.display
-from pydub import AudioSegment
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.lazy import Lazy, warm_up
+from common.parsing import SENSOR_FIELDS, ParseError, parse_message, parse_reading
+from common.sampled_log import PayloadLog, setup_logging
 
 def get_ip():
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -35,106 +33,122 @@ print(f"Your Computer Name is: {hostname}")
 print(f"Your Computer IP Address is: {IPAddr}")
 print(f"* Enter {IPAddr}:{port} in the app.\n* Press the 'Set IP Address' button.\n* Select the sensors to stream.\n* Update the 'update interval' by entering a value in ms.")
 
-def parse_sensor_data(data):
+payload_log = PayloadLog(logging.getLogger('visualizations'))
+PLOT_EVERY = 50  # readings between visualizations, also the number plotted
+SPECTROGRAM_EVERY = 1.0  # seconds of /audio between spectrogram updates
+# numpy, matplotlib, PIL and pydub are only imported by the stages below, on
+# first use or by a background warm-up once the port is open (common/lazy.py).
+WARM_UP = True
+
+def make_history():
+    from common.ringbuffer import SensorHistory
+    return SensorHistory()
+
+def start_renderer():
+    from renderer import PlotRenderer
+    renderer = PlotRenderer(SENSOR_FIELDS)
+    renderer.start()
+    return renderer
+
+def make_frame_pool():
+    # Camera frames are decoded, sepia-filtered and saved on a worker pool.
+    from filters import FramePool
+    return FramePool()
+
+def load_stft():
+    from common import stft
+    return stft
+
+def load_pyplot():
+    import matplotlib.pyplot as plt
+    return plt
+
+def load_pydub():
+    import pydub
+    return pydub
+
+sensor_history = Lazy(make_history)
+renderer = Lazy(start_renderer)
+frame_pool = Lazy(make_frame_pool)
+stft_module = Lazy(load_stft)
+pyplot = Lazy(load_pyplot)
+pydub = Lazy(load_pydub)
+
+def parse_sensor_data(sensor_type, data):
+    # Typed (timestamp, values) for sensors with a known schema, a dict otherwise.
     try:
-        return json.loads(data)
-    except json.JSONDecodeError:
+        if sensor_type in SENSOR_FIELDS:
+            return parse_reading(sensor_type, data)
+        return parse_message(data)
+    except ParseError:
         print(f"Error parsing JSON data: {data}")
         return None
 
-def plot_sensor_data(data_list, sensor_type):
-    df = pd.DataFrame(data_list)
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'], unit='ms')
-    
-    plt.figure(figsize=(12, 6))
-    for column in ['x', 'y', 'z']:
-        if column in df.columns:
-            plt.plot(df['Timestamp'], df[column].astype(float), label=column)
-    
-    plt.title(f"{sensor_type} Data Visualization")
-    plt.xlabel("Timestamp")
-    plt.ylabel("Value")
-    plt.legend()
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    
-    buf = BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    plt.close()
-    return buf
-
 async def process_sensor_data(websocket, sensor_type):
-    data_list = []
     async for message in websocket:
-        parsed_data = parse_sensor_data(message)
+        parsed_data = parse_sensor_data(sensor_type, message)
         if parsed_data:
-            print(f"Received {sensor_type} data: {parsed_data}")
-            data_list.append(parsed_data)
+            payload_log.message(f"/{sensor_type}", parsed_data, len(message))
             
             with open(f"{sensor_type.lower()}.txt", "a") as f:
-                json.dump(parsed_data, f)
+                f.write(message)
                 f.write("\n")
             
-            if len(data_list) >= 50:  # Create visualization every 50 data points
-                buf = plot_sensor_data(data_list, sensor_type)
-                img = Image.open(buf)
-                img.save(f"{sensor_type.lower()}_visualization.png")
-                print(f"Created visualization for {sensor_type}")
-                data_list = data_list[-50:]  # Keep only the last 50 points for the next visualization
+            if sensor_type not in SENSOR_FIELDS:
+                continue
+            history = sensor_history.get().append(sensor_type, *parsed_data)
+            
+            if history.count % PLOT_EVERY == 0:  # Create visualization every 50 data points
+                # Rendered on the renderer thread; only the newest window is drawn if it falls behind.
+                renderer.get().submit(sensor_type, *history.last(PLOT_EVERY), f"{sensor_type.lower()}_visualization.png")
 
 async def process_image(data):
+    # Apply a creative filter (sepia, see filters.py) off the event loop.
     parsed_response = json.loads(data)
     image_data = b64decode(parsed_response['Base64Data'])
-    img = Image.open(BytesIO(image_data))
-    
-    # Apply a creative filter (e.g., sepia)
-    sepia_filter = np.array([
-        [0.393, 0.769, 0.189],
-        [0.349, 0.686, 0.168],
-        [0.272, 0.534, 0.131]
-    ])
-    sepia_img = Image.fromarray(np.dot(np.array(img), sepia_filter.T).astype(np.uint8))
-    sepia_img.save(f"sepia_{parsed_response['Timestamp']}.png")
-    print(f"Processed and saved sepia image with timestamp {parsed_response['Timestamp']}")
-
-async def process_audio(audio_data):
+    # Bounded: when the pool falls behind, frames are dropped (see frames_summary).
+    frame_pool.get().submit(image_data, f"sepia_{parsed_response['Timestamp']}.png")
+    payload_log.message('/camera', f"Queued frame {parsed_response['Timestamp']} for sepia", len(data))
+
+async def process_audio(websocket):
+    # Appends each PCM chunk to audio.wav and to a rolling spectrogram; only the
+    # new STFT frames are computed, so cost per chunk stays flat.
+    stft = stft_module.get().StreamingSTFT(sample_rate=48000)
+    rendered_at = 0.0
     with wave.open('audio.wav', 'wb') as wav:
         wav.setnchannels(1)
         wav.setsampwidth(2)
         wav.setframerate(48000)
-        wav.writeframes(audio_data)
-    
-    # Generate spectrogram
-    y, sr = librosa.load('audio.wav')
-    D = librosa.stft(y)
-    S_db = librosa.amplitude_to_db(np.abs(D), ref=np.max)
-    
-    plt.figure(figsize=(12, 8))
-    librosa.display.specshow(S_db, sr=sr, x_axis='time', y_axis='hz')
-    plt.colorbar(format='%+2.0f dB')
-    plt.title('Spectrogram')
-    plt.tight_layout()
-    plt.savefig('audio_spectrogram.png')
-    plt.close()
-    print("Generated audio spectrogram")
+        async for message in websocket:
+            audio_data = b64decode(message, ' /')
+            payload_log.message('/audio', f"{len(audio_data)} bytes of PCM", len(message))
+            wav.writeframes(audio_data)
+            stft.feed_pcm(audio_data)
+            if stft.duration() - rendered_at >= SPECTROGRAM_EVERY:
+                rendered_at = stft.duration()
+                renderer.get().submit_spectrogram('audio', stft.spectrogram(), 'audio_spectrogram.png')
+    renderer.get().submit_spectrogram('audio', stft.spectrogram(), 'audio_spectrogram.png')
+    print(f"Wrote {stft.duration():.1f}s of audio to audio.wav")
 
 async def process_3gp_audio(file_path):
     print(f"Processing 3GP audio file: {file_path}")
+    import numpy as np
+    plt, stft = pyplot.get(), stft_module.get()
     
     # Convert 3GP to WAV
-    audio = AudioSegment.from_file(file_path, format="3gp")
+    audio = pydub.get().AudioSegment.from_file(file_path, format="3gp")
     wav_path = file_path.replace('.3gp', '.wav')
     audio.export(wav_path, format="wav")
     print(f"Converted 3GP to WAV: {wav_path}")
     
-    # Generate spectrogram
-    y, sr = librosa.load(wav_path)
-    D = librosa.stft(y)
-    S_db = librosa.amplitude_to_db(np.abs(D), ref=np.max)
+    # Generate spectrogram, at the recording's own sample rate
+    y, sr = stft.segment_samples(audio), audio.frame_rate
+    S_db = stft.spectrogram(y, sr)
     
     plt.figure(figsize=(12, 8))
-    librosa.display.specshow(S_db, sr=sr, x_axis='time', y_axis='hz')
+    plt.imshow(S_db, origin='lower', aspect='auto', cmap='magma', extent=(0, S_db.shape[1] * stft.HOP / sr, 0, sr / 2))
+    plt.xlabel('Time (s)')
+    plt.ylabel('Hz')
     plt.colorbar(format='%+2.0f dB')
     plt.title('3GP Audio Spectrogram')
     plt.tight_layout()
@@ -145,7 +159,8 @@ async def process_3gp_audio(file_path):
     
     # Generate waveform
     plt.figure(figsize=(12, 4))
-    librosa.display.waveshow(y, sr=sr)
+    plt.plot(np.arange(len(y)) / sr, y, linewidth=0.5)
+    plt.xlabel('Time (s)')
     plt.title('3GP Audio Waveform')
     plt.tight_layout()
     waveform_path = file_path.replace('.3gp', '_waveform.png')
@@ -157,27 +172,49 @@ async def echo(websocket, path):
     if path in ['/accelerometer', '/gyroscope', '/magnetometer', '/orientation', '/stepcounter', '/thermometer', '/lightsensor', '/proximity', '/geolocation']:
         await process_sensor_data(websocket, path[1:])
     elif path == '/camera':
-        data = await websocket.recv()
-        await process_image(data)
+        async for data in websocket:
+            await process_image(data)
     elif path == '/audio':
-        data = await websocket.recv()
-        decoded_data = b64decode(data, ' /')
-        await process_audio(decoded_data)
+        await process_audio(websocket)
     elif path == '/pro/audio':
-        try:
-            data = await websocket.recv()
-            decoded_data = b64decode(data)
-            file_path = 'audio.3gp'
-            with open(file_path, 'wb') as gp3:
-                gp3.write(decoded_data)
-            print("Saved 3GP audio file")
-            await process_3gp_audio(file_path)
-        except Exception as e:
-            print(f"Error processing audio: {e}")
+        async for data in websocket:
+            try:
+                decoded_data = b64decode(data)
+                file_path = 'audio.3gp'
+                with open(file_path, 'wb') as gp3:
+                    gp3.write(decoded_data)
+                print("Saved 3GP audio file")
+                await process_3gp_audio(file_path)
+            except Exception as e:
+                print(f"Error processing audio: {e}")
+
+def renderer_summary():
+    if not renderer.loaded:
+        return "plots renderer not loaded"
+    return f"plots rendered {renderer.get().rendered} coalesced {renderer.get().coalesced}"
+
+def frames_summary():
+    if not frame_pool.loaded:
+        return "frame pool not loaded"
+    pool = frame_pool.get()
+    return f"frames filtered {pool.processed} dropped {pool.dropped} queued {pool.depth()}"
 
 async def main():
-    async with websockets.serve(echo, '0.0.0.0', port, max_size=1_000_000_000):
-        await asyncio.Future()
+    setup_logging()
+    payload_log.add_summary_source(renderer_summary)
+    payload_log.add_summary_source(frames_summary)
+    summary_task = asyncio.create_task(payload_log.run_summaries())
+    try:
+        async with websockets.serve(echo, '0.0.0.0', port, max_size=1_000_000_000):
+            if WARM_UP:
+                asyncio.create_task(warm_up(sensor_history, renderer, stft_module, frame_pool, pyplot, pydub))
+            await asyncio.Future()
+    finally:
+        summary_task.cancel()
+        if renderer.loaded:
+            renderer.get().close()
+        if frame_pool.loaded:
+            frame_pool.get().close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""Binary WebSocket payloads for /camera, /audio and /pro/audio.
+
+Newer app versions send media as binary frames instead of base64 text (and,
+for the camera, JSON around it): a 12-byte little-endian header followed by
+the raw payload.
+
+    offset  size  field
+         0     2  magic b"SS"
+         2     1  version (1)
+         3     1  format (FORMAT_* below)
+         4     8  timestamp, int64 ms since the epoch
+
+The payload is handed on as a memoryview slice of the received message, so
+it reaches the file without being decoded or copied. Text messages keep
+working as before.
+"""
+
+import struct
+
+HEADER = struct.Struct("<2sBBq")
+MAGIC = b"SS"
+VERSION = 1
+
+FORMAT_PNG = 1
+FORMAT_JPEG = 2
+FORMAT_PCM16 = 3  # raw little-endian 16-bit PCM, as /audio's base64 text
+FORMAT_3GP = 4
+
+SUFFIXES = {FORMAT_PNG: ".png", FORMAT_JPEG: ".jpg"}
+# What each endpoint stores; a binary frame in any other format is rejected.
+ENDPOINT_FORMATS = {
+    "/camera": (FORMAT_PNG, FORMAT_JPEG),
+    "/audio": (FORMAT_PCM16,),
+    "/pro/audio": (FORMAT_3GP,),
+}
+
+
+def pack(fmt, timestamp, payload):
+    # Header + payload as one message; for clients and loadgen.py.
+    return HEADER.pack(MAGIC, VERSION, fmt, timestamp) + payload
+
+
+def unpack(message, formats=None):
+    # (format, timestamp, payload memoryview) of a binary message. Raises
+    # ValueError when the header is missing or from a newer protocol, or the
+    # format is not one of `formats`.
+    if len(message) < HEADER.size:
+        raise ValueError(f"binary message too short ({len(message)} bytes)")
+    magic, version, fmt, timestamp = HEADER.unpack_from(message)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"unknown binary header {magic!r} v{version}")
+    if formats is not None and fmt not in formats:
+        raise ValueError(f"unexpected format {fmt}")
+    return fmt, timestamp, memoryview(message)[HEADER.size:]
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import logging
+import time
+from base64 import b64decode
+from concurrent.futures import ThreadPoolExecutor
+
+import binary_frames
+import metrics
+
+WORKERS = 2
+QUEUE_SIZE = 8
+DROP_OLDEST = "oldest"
+DROP_NEWEST = "newest"
+
+log = logging.getLogger(__name__)
+
+
+def decode_frame(message):
+    # (timestamp, image bytes, file suffix) of a camera message: JSON with
+    # base64 data from older apps, or a binary frame (see binary_frames.py).
+    if isinstance(message, str):
+        payload = json.loads(message)
+        return int(payload["Timestamp"]), b64decode(payload["Base64Data"]), ".png"
+    fmt, timestamp, image_data = binary_frames.unpack(message, binary_frames.ENDPOINT_FORMATS["/camera"])
+    return timestamp, image_data, binary_frames.SUFFIXES[fmt]
+
+
+def save_frame(root, message):
+    # Decode one camera message and write it out as {Timestamp}.png (.jpg for
+    # binary JPEG frames). Blocking.
+    started = time.perf_counter()
+    timestamp, image_data, suffix = decode_frame(message)
+    decoded = time.perf_counter()
+    metrics.DECODE_SECONDS.observe(decoded - started, "/camera")
+
+    root.mkdir(parents=True, exist_ok=True)
+    filename = root / f"{timestamp}{suffix}"
+    with open(filename, "wb") as f:
+        f.write(image_data)
+    metrics.WRITE_SECONDS.observe(time.perf_counter() - decoded, "camera")
+    metrics.PERSIST_LATENCY.observe(time.time() - timestamp / 1000, "/camera")
+    return filename
+
+
+def archive_frame(archive, message):
+    # Decode one camera message and append it to a FrameArchive. Blocking.
+    started = time.perf_counter()
+    timestamp, image_data, _ = decode_frame(message)
+    decoded = time.perf_counter()
+    metrics.DECODE_SECONDS.observe(decoded - started, "/camera")
+
+    segment = archive.append(timestamp, image_data)
+    metrics.WRITE_SECONDS.observe(time.perf_counter() - decoded, "camera")
+    metrics.PERSIST_LATENCY.observe(time.time() - timestamp / 1000, "/camera")
+    return f"{timestamp} in segment {segment}"
+
+
+class CameraPipeline:
+    """Bounded queue of camera frames handled by a thread pool.
+
+    `submit(*args)` never blocks the event loop: when the queue is full it either
+    discards the oldest queued frame to make room (`DROP_OLDEST`, keeps the
+    stream live) or discards the incoming one (`DROP_NEWEST`, keeps what is
+    already queued). Decoding and the file write both happen in
+    `save(*args)` on the pool.
+    """
+
+    def __init__(self, save, workers=WORKERS, queue_size=QUEUE_SIZE, drop_policy=DROP_OLDEST):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.save = save
+        self.workers = workers
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._queue = None
+        self._executor = None
+        self._tasks = []
+
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, *args):
+        if self._queue.full():
+            self.dropped += 1
+            if self.drop_policy == DROP_NEWEST:
+                return False
+            self._queue.get_nowait()
+        self._queue.put_nowait(args)
+        return True
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="camera")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        # Let the workers finish what is already queued, then stop them.
+        for _ in self._tasks:
+            await self._queue.put(None)
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+        self._executor.shutdown(wait=True)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            args = await self._queue.get()
+            if args is None:
+                return
+            try:
+                result = await loop.run_in_executor(self._executor, self.save, *args)
+                self.processed += 1
+                log.debug("[camera] Saved image %s (processed %d, dropped %d)", result, self.processed, self.dropped)
+            except Exception as e:
+                self.failed += 1
+                log.error("[camera] Error: %s", e)
@@ -0,0 +1,199 @@
+import json
+import math
+import sys
+from array import array
+from pathlib import Path
+
+# Fixed per-sensor schemas, following the data format cheat sheet in the
+# README. Every reading becomes one int64 timestamp plus one float32 per field.
+SCHEMAS = {
+    "accelerometer": ("x", "y", "z"),
+    "gyroscope": ("x", "y", "z"),
+    "magnetometer": ("x", "y", "z"),
+    "orientation": ("azimuth", "pitch", "roll"),
+    "stepcounter": ("steps",),
+    "thermometer": ("temperature",),
+    "lightsensor": ("illuminance",),
+    "proximity": ("isNear", "value", "maxRange"),
+}
+
+# Alternative spellings some app versions use for the same field.
+ALIASES = {
+    "illuminance": ("illuminance", "light"),
+}
+
+TIMESTAMP_COLUMN = "Timestamp.i64"
+SEGMENT_ROWS = 1_000_000
+BATCH_ROWS = 4096  # hand columns to the writer at least this often
+
+
+def column_file(field):
+    return f"{field}.f32"
+
+
+def _le_bytes(column):
+    # Files are always little-endian so they can be mapped on any host.
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def parse_reading(sensor, message):
+    # Parse one JSON reading (text or already decoded) into (timestamp,
+    # values) following SCHEMAS.
+    data = json.loads(message) if isinstance(message, str) else message
+    values = []
+    for field in SCHEMAS[sensor]:
+        value = None
+        for key in ALIASES.get(field, (field,)):
+            value = data.get(key)
+            if value is not None:
+                break
+        values.append(math.nan if value is None else float(value))
+    return int(data["Timestamp"]), values
+
+
+class ColumnarStore:
+    """Typed, append-only column storage for sensor readings.
+
+    Each sensor gets numbered segment directories under `root`, holding one
+    little-endian file per column (`Timestamp.i64`, `x.f32`, ...) plus a
+    `schema.json`. Rows are collected in typed arrays and handed to the
+    BufferedWriter in bulk, so the files can later be memory-mapped as-is
+    with `load()`/`segments()`.
+    """
+
+    def __init__(self, writer, root="columnar", segment_rows=SEGMENT_ROWS, batch_rows=BATCH_ROWS):
+        self.writer = writer
+        self.root = Path(root)
+        self.segment_rows = segment_rows
+        self.batch_rows = batch_rows
+        self._sensors = {}
+        self._last_segment = {}
+        writer.add_flush_hook(self.drain)
+
+    def _segment_dir(self, sensor):
+        number = self._last_segment.get(sensor)
+        if number is None:
+            # Never append to a segment from an earlier run, so columns stay aligned.
+            base = self.writer.root / self.root / sensor
+            existing = [int(p.name) for p in base.glob("*") if p.name.isdigit()] if base.is_dir() else []
+            number = max(existing, default=0)
+        number += 1
+        self._last_segment[sensor] = number
+        # Created now rather than on the next flush, so a store opened for the
+        # same root in the meantime (a device reconnecting) doesn't reuse it.
+        directory = self.root / sensor / f"{number:06d}"
+        (self.writer.root / directory).mkdir(parents=True, exist_ok=True)
+        return directory
+
+    def _open_segment(self, sensor):
+        directory = self._segment_dir(sensor)
+        schema = {
+            "sensor": sensor,
+            "columns": {"Timestamp": "<i8", **{field: "<f4" for field in SCHEMAS[sensor]}},
+        }
+        self.writer.write(str(directory / "schema.json"), json.dumps(schema).encode())
+        self.writer.release(str(directory / "schema.json"))
+        state = {
+            "sensor": sensor,
+            "dir": directory,
+            "rows": 0,
+            "timestamps": array("q"),
+            "columns": [array("f") for _ in SCHEMAS[sensor]],
+        }
+        self._sensors[sensor] = state
+        return state
+
+    def append(self, sensor, message):
+        # Parse and store one reading; returns its timestamp.
+        parsed = parse_reading(sensor, message)
+        self.extend(sensor, [parsed])
+        return parsed[0]
+
+    def extend(self, sensor, parsed):
+        # Append a batch of readings, already parsed into (timestamp, values)
+        # pairs by parse_reading(), with one extend per column instead of one
+        # append per value.
+        while parsed:
+            state = self._sensors.get(sensor) or self._open_segment(sensor)
+            room = self.segment_rows - state["rows"]
+            chunk, parsed = parsed[:room], parsed[room:]
+            state["timestamps"].extend(timestamp for timestamp, _ in chunk)
+            for i, column in enumerate(state["columns"]):
+                column.extend(values[i] for _, values in chunk)
+            state["rows"] += len(chunk)
+
+            if state["rows"] >= self.segment_rows:
+                self._drain_sensor(state)
+                self._seal(state)
+            elif len(state["timestamps"]) >= self.batch_rows:
+                self._drain_sensor(state)
+
+    def _drain_sensor(self, state):
+        if not state["timestamps"]:
+            return
+        directory = state["dir"]
+        self.writer.write(
+            str(directory / TIMESTAMP_COLUMN), _le_bytes(state["timestamps"]), stamps=state["timestamps"]
+        )
+        for field, column in zip(SCHEMAS[state["sensor"]], state["columns"]):
+            self.writer.write(str(directory / column_file(field)), _le_bytes(column))
+        state["timestamps"] = array("q")
+        state["columns"] = [array("f") for _ in state["columns"]]
+
+    def _seal(self, state):
+        directory = state["dir"]
+        self.writer.release(str(directory / TIMESTAMP_COLUMN))
+        for field in SCHEMAS[state["sensor"]]:
+            self.writer.release(str(directory / column_file(field)))
+        del self._sensors[state["sensor"]]
+
+    def drain(self):
+        for state in list(self._sensors.values()):
+            self._drain_sensor(state)
+
+    def close(self):
+        # Hand over what is buffered, close the open segments and detach from
+        # the writer. Later readings would start new segments.
+        for state in list(self._sensors.values()):
+            self._drain_sensor(state)
+            self._seal(state)
+        self.writer.remove_flush_hook(self.drain)
+
+
+# Reading side. NumPy is only needed here, not for ingest.
+
+def segments(data_dir, sensor, root="columnar"):
+    # Yield one dict of memory-mapped columns per segment, oldest first.
+    import numpy as np
+
+    base = Path(data_dir) / root / sensor
+    if not base.is_dir():
+        return
+    for directory in sorted(p for p in base.iterdir() if p.name.isdigit()):
+        files = {"Timestamp": (directory / TIMESTAMP_COLUMN, np.dtype("<i8"))}
+        for field in SCHEMAS[sensor]:
+            files[field] = (directory / column_file(field), np.dtype("<f4"))
+        if not all(path.exists() for path, _ in files.values()):
+            continue
+        # A crash can leave columns of different lengths; trust the shortest.
+        rows = min(path.stat().st_size // dtype.itemsize for path, dtype in files.values())
+        if rows == 0:
+            continue
+        yield {
+            name: np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+            for name, (path, dtype) in files.items()
+        }
+
+
+def load(data_dir, sensor, root="columnar"):
+    # Concatenate every segment of `sensor` into plain arrays.
+    import numpy as np
+
+    parts = list(segments(data_dir, sensor, root))
+    names = ("Timestamp",) + SCHEMAS[sensor]
+    if not parts:
+        return {name: np.empty(0, dtype="<i8" if name == "Timestamp" else "<f4") for name in names}
+    return {name: np.concatenate([part[name] for part in parts]) for name in names}
@@ -0,0 +1,108 @@
+import json
+import re
+import time
+from pathlib import PurePosixPath
+
+from columnar import ColumnarStore
+from frame_archive import FrameArchive
+from rollups import WINDOWS, Rollups
+
+# Phones that don't identify themselves share the original, flat DATA_DIR layout.
+DEFAULT_DEVICE = "default"
+DEVICES_DIR = "devices"
+
+_DEVICE_ID = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+def valid_device_id(device_id):
+    return bool(_DEVICE_ID.match(device_id)) and device_id not in (".", "..")
+
+
+def device_file(device_id, filename):
+    # Storage name (relative to DATA_DIR) of `filename` for one device.
+    if device_id == DEFAULT_DEVICE:
+        return str(PurePosixPath(filename))
+    return str(PurePosixPath(DEVICES_DIR, device_id, filename))
+
+
+def split_device(url_path, query):
+    # Device id from a /device/<id>/<endpoint> prefix or a ?device=<id>
+    # parameter. Returns (endpoint path, device id or None).
+    if url_path.startswith("/device/"):
+        device_id, _, rest = url_path[len("/device/"):].partition("/")
+        return "/" + rest, device_id
+    return url_path, query.get("device", [None])[0]
+
+
+def parse_handshake(message):
+    # A first message carrying "DeviceId" names the device. Returns
+    # (device id or None, True if the message is only a handshake).
+    if not isinstance(message, str) or '"DeviceId"' not in message[:256]:
+        return None, False
+    try:
+        data = json.loads(message)
+        device_id = str(data["DeviceId"])
+    except (ValueError, KeyError, TypeError):
+        return None, False
+    return device_id, "Timestamp" not in data
+
+
+class DeviceSession:
+    """Per-device state shared by all of a phone's sensor connections."""
+
+    def __init__(self, device_id, writer, rollup_windows=WINDOWS):
+        self.device_id = device_id
+        self.endpoints = {}  # endpoint path -> open connection count
+        self.messages = 0
+        self.first_seen = time.time()
+        self.last_seen = self.first_seen
+        self.root = writer.root / device_file(device_id, ".")
+        self.columnar = ColumnarStore(writer, root=device_file(device_id, "columnar"))
+        self.frames = FrameArchive(self.root / "frames")  # camera frames in archive mode
+        self.rollups = Rollups(writer, root=device_file(device_id, "rollups"), windows=rollup_windows)
+        self.raw_seen = {}  # sensor -> readings received, for raw decimation
+
+    def file(self, filename):
+        return device_file(self.device_id, filename)
+
+    def close(self):
+        # Write out what is still buffered and let go of files and hooks.
+        self.columnar.close()
+        self.rollups.close()
+        self.frames.close()
+
+    @property
+    def online(self):
+        return any(self.endpoints.values())
+
+
+class DeviceRegistry:
+    def __init__(self, writer, rollup_windows=WINDOWS):
+        self.writer = writer
+        self.rollup_windows = rollup_windows
+        self.sessions = {}
+
+    def connect(self, device_id, endpoint):
+        session = self.sessions.get(device_id)
+        if session is None:
+            session = self.sessions[device_id] = DeviceSession(device_id, self.writer, self.rollup_windows)
+        session.endpoints[endpoint] = session.endpoints.get(endpoint, 0) + 1
+        session.last_seen = time.time()
+        return session
+
+    def disconnect(self, session, endpoint):
+        session.endpoints[endpoint] -= 1
+        session.last_seen = time.time()
+
+    def online(self):
+        return sum(1 for session in self.sessions.values() if session.online)
+
+    def evict_idle(self, max_idle):
+        # Close and forget the sessions of devices offline for over `max_idle`
+        # seconds; they get a fresh session if they reconnect. Returns them.
+        cutoff = time.time() - max_idle
+        idle = [s for s in self.sessions.values() if not s.online and s.last_seen < cutoff]
+        for session in idle:
+            session.close()
+            del self.sessions[session.device_id]
+        return idle
@@ -0,0 +1,24 @@
+import json
+
+# Sensor messages are either a single JSON reading, as older apps send them,
+# or a batch of readings in one WebSocket frame: a JSON array of readings or
+# newline-delimited JSON (one reading per line).
+
+
+def split_envelope(message):
+    # (lines, readings) of one text message. `lines` are the readings as
+    # compact JSON strings, for text storage and subscribers; `readings` are
+    # the parsed dicts when a JSON array had to be parsed anyway, else None.
+    # A single reading comes back as ([message], None) without being parsed.
+    if message.lstrip()[:1] == "[":
+        readings = json.loads(message)
+        if not isinstance(readings, list):
+            raise ValueError("batch must be a JSON array of readings")
+        return [json.dumps(r, separators=(",", ":")) for r in readings], readings
+    if "\n" in message:
+        lines = [line for line in message.split("\n") if line.strip()]
+        # A pretty-printed single reading also spans lines; NDJSON lines are
+        # complete objects.
+        if len(lines) > 1 and lines[0].rstrip().endswith("}"):
+            return [line.strip() for line in lines], None
+    return [message], None
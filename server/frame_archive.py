@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Append-only archive of camera frames.
+
+Frames are appended to large segment files (frames/000001.seg, ...) and each
+gets a fixed-size entry (timestamp, offset, length) in the segment's index
+file (000001.idx), instead of one small file per frame.
+
+    python frame_archive.py list data/frames
+    python frame_archive.py export data/frames out/ [--start MS] [--end MS]
+"""
+
+import argparse
+import bisect
+import struct
+import threading
+from pathlib import Path
+
+SEGMENT_BYTES = 256 * 1024 * 1024  # start a new segment after this many bytes
+ENTRY = struct.Struct("<qQI")  # timestamp, byte offset in segment, byte length
+
+
+def image_suffix(data):
+    if data[:3] == b"\xff\xd8\xff":
+        return ".jpg"
+    return ".png"
+
+
+class Segment:
+    # The index of one segment, sorted by timestamp for lookups.
+
+    def __init__(self, number, entries):
+        entries.sort()
+        self.number = number
+        self.timestamps = [e[0] for e in entries]
+        self.entries = entries
+
+    @property
+    def first(self):
+        return self.timestamps[0]
+
+    @property
+    def last(self):
+        return self.timestamps[-1]
+
+
+class FrameArchive:
+    """Segment files plus index for one directory of frames.
+
+    `append()` is thread safe (the camera pool calls it from several
+    threads). A frame's data is written before its index entry, so after a
+    crash an entry never points past the end of its segment, and reopening
+    the archive drops any unindexed tail. Readers (`get`, `frames`) load segment indexes on
+    demand and read frames with plain seeks.
+    """
+
+    def __init__(self, root, segment_bytes=SEGMENT_BYTES):
+        self.root = Path(root)
+        self.segment_bytes = segment_bytes
+        self.frames_written = 0
+        self._lock = threading.Lock()
+        self._number = None
+        self._data = None
+        self._index = None
+        self._size = 0
+        self._sealed = {}  # segment number -> Segment, for segments no longer written
+
+    def _path(self, number, suffix):
+        return self.root / f"{number:06d}{suffix}"
+
+    def segment_numbers(self):
+        if not self.root.exists():
+            return []
+        return sorted(int(p.stem) for p in self.root.glob("*.idx") if p.stem.isdigit())
+
+    def _read_entries(self, number):
+        raw = self._path(number, ".idx").read_bytes()
+        raw = raw[:len(raw) - len(raw) % ENTRY.size]
+        data_size = self._path(number, ".seg").stat().st_size
+        return [e for e in ENTRY.iter_unpack(raw) if e[1] + e[2] <= data_size]
+
+    def _open(self):
+        # Continue the newest segment, trimming anything a crash left behind.
+        self.root.mkdir(parents=True, exist_ok=True)
+        numbers = self.segment_numbers()
+        self._number = numbers[-1] if numbers else 1
+        data_path = self._path(self._number, ".seg")
+        index_path = self._path(self._number, ".idx")
+        entries = self._read_entries(self._number) if numbers else []
+        self._size = max((e[1] + e[2] for e in entries), default=0)
+        with open(data_path, "ab") as f:
+            f.truncate(self._size)
+        with open(index_path, "ab") as f:
+            f.truncate(len(entries) * ENTRY.size)
+        self._data = open(data_path, "ab", buffering=0)
+        self._index = open(index_path, "ab")
+
+    def _roll(self):
+        self._close_files()
+        self._number += 1
+        self._size = 0
+        self._data = open(self._path(self._number, ".seg"), "ab", buffering=0)
+        self._index = open(self._path(self._number, ".idx"), "ab")
+
+    def append(self, timestamp, data):
+        with self._lock:
+            if self._data is None:
+                self._open()
+            elif self._size and self._size + len(data) > self.segment_bytes:
+                self._roll()
+            self._data.write(data)
+            self._index.write(ENTRY.pack(timestamp, self._size, len(data)))
+            self._index.flush()
+            self._size += len(data)
+            self.frames_written += 1
+            return self._number
+
+    def _close_files(self):
+        for f in (self._data, self._index):
+            if f is not None:
+                f.close()
+        self._data = self._index = None
+
+    def close(self):
+        with self._lock:
+            self._close_files()
+
+    # Reading
+
+    def segments(self):
+        # Indexes of all segments, including the one being written. Older
+        # segments never change, so their indexes are read only once.
+        numbers = self.segment_numbers()
+        for number in numbers:
+            segment = self._sealed.get(number)
+            if segment is None:
+                entries = self._read_entries(number)
+                if not entries:
+                    continue
+                segment = Segment(number, entries)
+                if number != numbers[-1]:
+                    self._sealed[number] = segment
+            yield segment
+
+    def _read(self, number, offset, length):
+        with open(self._path(number, ".seg"), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def get(self, timestamp):
+        # Bytes of the frame with exactly this timestamp, or None.
+        for segment in self.segments():
+            if segment.first <= timestamp <= segment.last:
+                i = bisect.bisect_left(segment.timestamps, timestamp)
+                if i < len(segment.timestamps) and segment.timestamps[i] == timestamp:
+                    _, offset, length = segment.entries[i]
+                    return self._read(segment.number, offset, length)
+        return None
+
+    def frames(self, start=None, end=None):
+        # (timestamp, bytes) for start <= timestamp <= end, in timestamp order
+        # within each segment.
+        lo = float("-inf") if start is None else start
+        hi = float("inf") if end is None else end
+        for segment in self.segments():
+            if segment.last < lo or segment.first > hi:
+                continue
+            i = bisect.bisect_left(segment.timestamps, lo)
+            with open(self._path(segment.number, ".seg"), "rb") as f:
+                for timestamp, offset, length in segment.entries[i:]:
+                    if timestamp > hi:
+                        break
+                    f.seek(offset)
+                    yield timestamp, f.read(length)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    listing = commands.add_parser("list", help="show segments and their time ranges")
+    listing.add_argument("archive")
+    export = commands.add_parser("export", help="write frames back out as {Timestamp}.png/.jpg files")
+    export.add_argument("archive")
+    export.add_argument("out")
+    export.add_argument("--start", type=int)
+    export.add_argument("--end", type=int)
+    args = parser.parse_args()
+
+    archive = FrameArchive(args.archive)
+    if args.command == "list":
+        for segment in archive.segments():
+            size = archive._path(segment.number, ".seg").stat().st_size
+            print(f"{segment.number:06d}  {len(segment.entries):>7} frames  {size / 2**20:9.1f} MiB  "
+                  f"{segment.first} .. {segment.last}")
+    else:
+        out = Path(args.out)
+        out.mkdir(parents=True, exist_ok=True)
+        count = 0
+        for timestamp, data in archive.frames(args.start, args.end):
+            (out / f"{timestamp}{image_suffix(data)}").write_bytes(data)
+            count += 1
+        print(f"Exported {count} frames to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""Simulate many phones streaming to a Sensor Stream server.
+
+Each simulated client opens one WebSocket per endpoint and sends at a fixed
+rate: recorded readings replayed from a file (timestamps rewritten to "now"),
+synthetic readings for other sensors, and random camera frames / PCM audio as
+base64 (or, with --binary, as binary frames, see binary_frames.py). With
+--batch N, sensor readings are sent N per message as newline-delimited JSON,
+at the same reading rate. While sending, every connection pings the server
+once per second; the round trip is reported as ack latency and rises as soon
+as the server's event loop falls behind.
+
+    python loadgen.py --clients 20 --endpoint accelerometer=200 --endpoint gyroscope=200 \\
+        --endpoint camera=2 --duration 30
+
+When the server exposes /metrics (server/server.py does), received counts,
+queue drops and RSS are scraped before and after the run so dropped messages
+can be reported: those that never arrived, plus camera frames the server's
+bounded queue discarded. Subscriber and log drops are reported separately.
+For the sample servers, pass --pid to read RSS from /proc instead.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import urllib.request
+from base64 import b64encode
+from pathlib import Path
+
+import websockets
+
+import binary_frames
+from columnar import SCHEMAS
+
+DEFAULT_TRACE = Path(__file__).resolve().parent.parent / "samples" / "visualizations" / "sample_outputs" / "accelerometer.txt"
+
+_TIMESTAMP = re.compile(r'"Timestamp"\s*:\s*\d+')
+_METRIC = re.compile(r'^(\w+)(?:\{(\w+)="([^"]*)"\})? (\S+)$')
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class Payloads:
+    # Produces the next message for an endpoint, with a fresh Timestamp.
+
+    def __init__(self, trace, camera_bytes, audio_bytes, binary=False, batch=1):
+        self.trace = {}
+        self.binary = binary
+        self.batch = batch
+        if trace:
+            lines = [line.strip() for line in open(trace) if line.strip()]
+            sensor = json.loads(lines[0]).get("SensorName", "").lower()
+            self.trace[sensor] = lines
+        self.camera_raw = os.urandom(camera_bytes)
+        self.audio_raw = os.urandom(audio_bytes - audio_bytes % 2)
+        self.camera = b64encode(self.camera_raw).decode()
+        self.audio = b64encode(self.audio_raw).decode()
+
+    def make(self, endpoint, i):
+        sensor = endpoint.strip("/")
+        if self.binary and sensor == "camera":
+            return binary_frames.pack(binary_frames.FORMAT_PNG, now_ms(), self.camera_raw)
+        if self.binary and sensor in ("audio", "pro/audio"):
+            fmt = binary_frames.FORMAT_PCM16 if sensor == "audio" else binary_frames.FORMAT_3GP
+            return binary_frames.pack(fmt, now_ms(), self.audio_raw)
+        if sensor == "camera":
+            return json.dumps({"Timestamp": now_ms(), "Base64Data": self.camera})
+        if sensor in ("audio", "pro/audio"):
+            return self.audio
+        stamp = f'"Timestamp":{now_ms()}'
+        if sensor in self.trace:
+            lines = self.trace[sensor]
+            return _TIMESTAMP.sub(stamp, lines[i % len(lines)], count=1)
+        fields = SCHEMAS.get(sensor, ("latitude", "longitude"))
+        values = ",".join(f'"{field}":"{random.uniform(-10, 10):.6f}"' for field in fields)
+        return f'{{"SensorName":"{sensor}",{stamp},{values}}}'
+
+    def batch_size(self, endpoint):
+        return 1 if endpoint in ("/camera", "/audio", "/pro/audio") else self.batch
+
+    def make_batch(self, endpoint, i):
+        # Message number `i`: one payload, or batch_size() readings as NDJSON.
+        size = self.batch_size(endpoint)
+        if size == 1:
+            return self.make(endpoint, i)
+        return "\n".join(self.make(endpoint, i * size + k) for k in range(size))
+
+
+class Stats:
+    def __init__(self):
+        self.sent = {}
+        self.ping_ms = []
+        self.behind_ms = 0.0
+        self.errors = 0
+
+
+async def run_stream(url, endpoint, rate, duration, payloads, stats, device=None):
+    interval = payloads.batch_size(endpoint) / rate
+    pings = []
+    target = url + endpoint + (f"?device={device}" if device else "")
+    async with websockets.connect(target, max_size=None) as ws:
+
+        async def pinger():
+            while True:
+                await asyncio.sleep(1.0)
+                started = time.perf_counter()
+                waiter = await ws.ping()
+                await waiter
+                pings.append((time.perf_counter() - started) * 1000)
+
+        ping_task = asyncio.create_task(pinger())
+        start = time.perf_counter()
+        i = 0
+        try:
+            while True:
+                due = start + i * interval
+                if due - start >= duration:
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    stats.behind_ms = max(stats.behind_ms, -delay * 1000)
+                await ws.send(payloads.make_batch(endpoint, i))
+                stats.sent[endpoint] = stats.sent.get(endpoint, 0) + 1
+                i += 1
+        finally:
+            ping_task.cancel()
+    stats.ping_ms.extend(pings)
+
+
+async def run_client(url, streams, duration, payloads, stats, device=None):
+    results = await asyncio.gather(
+        *(run_stream(url, endpoint, rate, duration, payloads, stats, device) for endpoint, rate in streams),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            stats.errors += 1
+            print(f"Client error: {result!r}")
+
+
+def scrape(metrics_urls):
+    # {path: messages}, {queue: items dropped} and RSS from the server's
+    # Prometheus endpoint(s), summed over all URLs in a comma-separated list
+    # (one per worker process).
+    received, dropped, rss = {}, {}, None
+    for metrics_url in metrics_urls.split(","):
+        with urllib.request.urlopen(metrics_url, timeout=5) as response:
+            for line in response.read().decode().splitlines():
+                match = _METRIC.match(line)
+                if not match:
+                    continue
+                name, label, key, value = match.groups()
+                if name == "sensorstream_messages_total" and label == "path":
+                    received[key] = received.get(key, 0) + float(value)
+                elif name == "sensorstream_dropped_items" and label == "queue":
+                    dropped[key] = dropped.get(key, 0) + float(value)
+                elif name == "process_resident_memory_bytes":
+                    rss = (rss or 0) + float(value)
+    return received, dropped, rss
+
+
+def pid_rss(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def parse_endpoint(spec):
+    name, _, rate = spec.partition("=")
+    return "/" + name.strip("/"), float(rate or 100)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="ws://127.0.0.1:5000")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--endpoint", action="append", type=parse_endpoint,
+                        help="NAME=RATE in messages/s per client, e.g. accelerometer=200 (repeatable)")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--trace", default=DEFAULT_TRACE, help="recorded readings to replay")
+    parser.add_argument("--camera-bytes", type=int, default=500_000)
+    parser.add_argument("--audio-bytes", type=int, default=9_600)
+    parser.add_argument("--batch", type=int, default=1, help="sensor readings per message")
+    parser.add_argument("--binary", action="store_true", help="send camera and audio as binary frames")
+    parser.add_argument("--metrics", default="http://127.0.0.1:5001/metrics", help="comma-separated for several workers, '' to disable")
+    parser.add_argument("--pid", type=int, help="server process to read RSS from")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds to wait before the final scrape")
+    parser.add_argument("--devices", action="store_true",
+                        help="give every client its own device id (?device=sim-N)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    streams = args.endpoint or [("/accelerometer", 100.0)]
+    payloads = Payloads(args.trace, args.camera_bytes, args.audio_bytes, args.binary, args.batch)
+    stats = Stats()
+    loop = asyncio.get_running_loop()
+
+    before, dropped_before = {}, {}
+    if args.metrics:
+        try:
+            before, dropped_before, _ = await loop.run_in_executor(None, scrape, args.metrics)
+        except OSError as e:
+            print(f"Metrics unavailable ({e}); not reporting drops")
+            args.metrics = ""
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_client(args.url, streams, args.duration, payloads, stats, f"sim-{n}" if args.devices else None)
+        for n in range(args.clients)
+    ))
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(args.settle)
+
+    report = {
+        "clients": args.clients,
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": {},
+        "ack_p50_ms": round(percentile(stats.ping_ms, 50), 2),
+        "ack_p99_ms": round(percentile(stats.ping_ms, 99), 2),
+        "max_send_behind_ms": round(stats.behind_ms, 1),
+        "client_errors": stats.errors,
+        "server_rss_mb": None,
+    }
+
+    received, queue_dropped, rss = {}, {}, None
+    if args.metrics:
+        after, dropped_after, rss = await loop.run_in_executor(None, scrape, args.metrics)
+        received = {path: after.get(path, 0) - before.get(path, 0) for path in after}
+        queue_dropped = {queue: int(n - dropped_before.get(queue, 0)) for queue, n in dropped_after.items()}
+        report["server_dropped"] = queue_dropped
+    if args.pid:
+        rss = pid_rss(args.pid)
+    if rss is not None:
+        report["server_rss_mb"] = round(rss / 2**20, 1)
+
+    for endpoint, sent in sorted(stats.sent.items()):
+        entry = {"sent": sent, "sent_per_s": round(sent / elapsed, 1)}
+        if args.metrics:
+            entry["received"] = int(received.get(endpoint, 0))
+            # Frames that arrived but were discarded by the camera queue count too.
+            entry["dropped"] = sent - entry["received"] + queue_dropped.get(endpoint.strip("/"), 0)
+        report["endpoints"][endpoint] = entry
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{args.clients} clients for {elapsed:.1f}s")
+    for endpoint, entry in report["endpoints"].items():
+        line = f"  {endpoint:<16} sent {entry['sent']:>9} ({entry['sent_per_s']:>9.1f}/s)"
+        if "received" in entry:
+            line += f"  received {entry['received']:>9}  dropped {entry['dropped']}"
+        print(line)
+    print(f"  ack latency p50 {report['ack_p50_ms']} ms, p99 {report['ack_p99_ms']} ms")
+    print(f"  worst send lag {report['max_send_behind_ms']} ms, client errors {stats.errors}")
+    if report.get("server_dropped"):
+        print("  server queue drops " + ", ".join(f"{queue} {n}" for queue, n in sorted(report["server_dropped"].items())))
+    if report["server_rss_mb"] is not None:
+        print(f"  server RSS {report['server_rss_mb']} MiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+from bisect import bisect_left
+
+# Seconds. Decode/write are sub-millisecond to tens of milliseconds; end-to-end
+# latency includes the writer's flush interval and phone clock skew.
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+log = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, *labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Gauge:
+    # Value is read from a callback at scrape time, e.g. a queue length.
+    kind = "gauge"
+
+    def __init__(self, name, help, *labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._callbacks = {}
+
+    def set_function(self, callback, *labels):
+        self._callbacks[labels] = callback
+
+    def samples(self):
+        for labels, callback in sorted(self._callbacks.items(), key=lambda item: item[0]):
+            yield f"{self.name}{_labels(self.labels, labels)} {callback()}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, *labels, buckets=FAST_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def observe_many(self, values, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = series[0]
+            for value in values:
+                counts[bisect_left(self.buckets, value)] += 1
+                series[1] += value
+                series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_labels(self.labels + ('le',), labels + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {count}"
+
+
+def resident_memory_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0
+    # Not Linux: fall back to the peak, which is the best we can do cheaply.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+MESSAGES = Counter("sensorstream_messages_total", "WebSocket messages received.", "path")
+READINGS = Counter("sensorstream_readings_total", "Sensor readings received (a batch message holds several).", "path")
+ROLLUP_LATE = Counter("sensorstream_rollup_late_total", "Readings left out of a rollup window because they arrived too late.", "window")
+BAD_READINGS = Counter("sensorstream_bad_readings_total", "Readings that could not be parsed against their schema.", "path")
+RECEIVED_BYTES = Counter("sensorstream_received_bytes_total", "Payload bytes received.", "path")
+DECODE_SECONDS = Histogram("sensorstream_decode_seconds", "Time spent parsing/decoding one message.", "path")
+WRITE_SECONDS = Histogram("sensorstream_write_seconds", "Time spent writing one batch or frame to disk.", "target")
+PERSIST_LATENCY = Histogram(
+    "sensorstream_persist_latency_seconds",
+    "Phone Timestamp to data flushed to disk (includes clock skew).",
+    "path",
+    buckets=LATENCY_BUCKETS,
+)
+QUEUE_DEPTH = Gauge("sensorstream_queue_depth", "Items waiting in an internal queue.", "queue")
+QUEUE_LAG = Gauge("sensorstream_queue_lag_seconds", "Age of the oldest item waiting in a queue.", "queue")
+DROPPED = Gauge("sensorstream_dropped_items", "Items dropped so far because a queue was full.", "queue")
+DEVICES = Gauge("sensorstream_devices_online", "Devices with at least one open connection.")
+ROTATED_FILES = Gauge("sensorstream_rotated_files", "Files sealed, compressed or deleted by rotation so far.", "action")
+ARCHIVED_BYTES = Gauge("sensorstream_archived_bytes", "Total size of sealed files kept on disk.")
+RSS = Gauge("process_resident_memory_bytes", "Resident memory size in bytes.")
+RSS.set_function(resident_memory_bytes)
+
+REGISTRY = [MESSAGES, READINGS, BAD_READINGS, ROLLUP_LATE, RECEIVED_BYTES, DECODE_SECONDS, WRITE_SECONDS, PERSIST_LATENCY,
+            QUEUE_DEPTH, QUEUE_LAG, DROPPED, DEVICES, ROTATED_FILES, ARCHIVED_BYTES, RSS]
+
+
+def render(registry=REGISTRY):
+    # Prometheus text exposition format, version 0.0.4.
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+async def _handle_http(reader, writer):
+    try:
+        request = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            body = render().encode()
+            status = "200 OK"
+        else:
+            body = b"Not found\n"
+            status = "404 Not Found"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host, port):
+    # Minimal HTTP server for GET /metrics; bind it to localhost.
+    server = await asyncio.start_server(_handle_http, host, port)
+    log.info("Metrics at http://%s:%d/metrics", host, port)
+    return server
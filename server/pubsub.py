@@ -0,0 +1,98 @@
+import asyncio
+from collections import deque
+
+LATEST = "latest"
+DECIMATE = "decimate"
+QUEUE_SIZE = 256  # readings held per subscriber before coalescing kicks in
+
+
+class Subscription:
+    """Bounded mailbox of readings for one live consumer.
+
+    `offer()` is called from the ingest path and never blocks or grows without
+    bound. In `LATEST` mode only the newest reading per topic is kept, so a slow
+    consumer always sees current values. In `DECIMATE` mode readings are queued
+    in order; when the queue is full every other queued reading is dropped,
+    so a consumer that can't keep up gets an evenly thinned stream instead of
+    a stale one.
+    """
+
+    def __init__(self, topics, device_id=None, mode=DECIMATE, queue_size=QUEUE_SIZE):
+        if mode not in (LATEST, DECIMATE):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.topics = frozenset(topics)
+        self.device_id = device_id
+        self.mode = mode
+        self.queue_size = queue_size
+        self.delivered = 0
+        self.coalesced = 0
+        self._latest = {}
+        self._queue = deque()
+        self._ready = asyncio.Event()
+
+    def depth(self):
+        return len(self._latest) if self.mode == LATEST else len(self._queue)
+
+    def offer(self, topic, message):
+        if self.mode == LATEST:
+            if topic in self._latest:
+                self.coalesced += 1
+            self._latest[topic] = message
+        else:
+            if len(self._queue) >= self.queue_size:
+                kept = list(self._queue)[1::2]
+                self.coalesced += len(self._queue) - len(kept)
+                self._queue = deque(kept)
+            self._queue.append(message)
+        self._ready.set()
+
+    async def get(self):
+        # Everything waiting, oldest first; waits until there is something.
+        await self._ready.wait()
+        self._ready.clear()
+        if self.mode == LATEST:
+            batch, self._latest = list(self._latest.values()), {}
+        else:
+            batch, self._queue = list(self._queue), deque()
+        self.delivered += len(batch)
+        return batch
+
+
+class Broker:
+    # Fans readings out to the subscriptions for their topic. Publishing to a
+    # topic nobody subscribed to costs one dict lookup.
+
+    def __init__(self):
+        self._topics = {}
+        self.subscriptions = set()
+        self.coalesced = 0  # from subscriptions that have since closed
+
+    def subscribe(self, subscription):
+        self.subscriptions.add(subscription)
+        for topic in subscription.topics:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+        self.coalesced += subscription.coalesced
+        for topic in subscription.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def publish(self, topic, device_id, message):
+        subscribers = self._topics.get(topic)
+        if not subscribers:
+            return
+        for subscription in subscribers:
+            if subscription.device_id is None or subscription.device_id == device_id:
+                subscription.offer(topic, message)
+
+    def depth(self):
+        return sum(subscription.depth() for subscription in self.subscriptions)
+
+    def dropped(self):
+        return self.coalesced + sum(subscription.coalesced for subscription in self.subscriptions)
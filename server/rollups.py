@@ -0,0 +1,162 @@
+import math
+import struct
+from pathlib import Path, PurePosixPath
+
+from columnar import SCHEMAS
+
+# Ingest-time min/max/mean per field over fixed time windows (in seconds),
+# so long ranges can be read and plotted from a few thousand rollup records
+# instead of millions of raw readings.
+WINDOWS = (1, 60)
+# Readings up to this many windows older than the newest one seen still count
+# towards their window; older ones are dropped from the rollups (not from the
+# raw data).
+LATENESS = 1
+
+RECORD_HEAD = struct.Struct("<qI")  # window start (ms), readings in window
+
+
+def record_struct(sensor):
+    # Window start, count, then min, max, mean (float32) for every field.
+    return struct.Struct(RECORD_HEAD.format + "fff" * len(SCHEMAS[sensor]))
+
+
+def series_name(sensor, window):
+    return str(PurePosixPath(sensor, f"{window}s.bin"))
+
+
+class _Series:
+    # Open windows of one sensor at one resolution.
+
+    def __init__(self, name, record, window, fields):
+        self.name = name
+        self.record = record
+        self.window = window
+        self.window_ms = window * 1000
+        self.fields = fields
+        self.buckets = {}  # window start -> [count, mins, maxs, sums, per-field counts]
+        self.newest = None
+        self.late = 0
+
+    def add(self, timestamp, values):
+        start = timestamp - timestamp % self.window_ms
+        closed = []
+        if self.newest is None or start > self.newest:
+            self.newest = start
+            horizon = start - LATENESS * self.window_ms
+            closed = sorted(s for s in self.buckets if s < horizon)
+        elif start < self.newest - LATENESS * self.window_ms:
+            self.late += 1
+            return closed
+
+        bucket = self.buckets.get(start)
+        if bucket is None:
+            n = self.fields
+            bucket = self.buckets[start] = [0, [math.inf] * n, [-math.inf] * n, [0.0] * n, [0] * n]
+        bucket[0] += 1
+        mins, maxs, sums, counts = bucket[1], bucket[2], bucket[3], bucket[4]
+        for i, value in enumerate(values):
+            if value != value:  # NaN: a missing value, skipped
+                continue
+            if value < mins[i]:
+                mins[i] = value
+            if value > maxs[i]:
+                maxs[i] = value
+            sums[i] += value
+            counts[i] += 1
+        return closed
+
+    def pack(self, start):
+        count, mins, maxs, sums, counts = self.buckets.pop(start)
+        fields = []
+        for i in range(self.fields):
+            if counts[i]:
+                fields += (mins[i], maxs[i], sums[i] / counts[i])
+            else:
+                fields += (math.nan, math.nan, math.nan)
+        return self.record.pack(start, count, *fields)
+
+
+class Rollups:
+    """Streaming rollup series for one device's sensors.
+
+    `add(sensor, readings)` takes parsed (timestamp, values) pairs (see
+    columnar.parse_reading). Every window that closes is appended as one
+    fixed-size little-endian record to `<root>/<sensor>/<window>s.bin`
+    through the BufferedWriter. Windows stay open for LATENESS windows after a
+    newer one starts, so readings that arrive slightly out of order still
+    count; `close()` writes the ones still open at shutdown
+    (or when the device's session is dropped). Missing values
+    (NaN) are skipped: a field's min/max/mean cover only the readings that
+    have it, and are NaN when none in the window did.
+    """
+
+    def __init__(self, writer, root="rollups", windows=WINDOWS):
+        self.writer = writer
+        self.root = PurePosixPath(root)
+        self.windows = tuple(windows)
+        self._series = {}
+
+    def _series_for(self, sensor):
+        series = self._series.get(sensor)
+        if series is None:
+            record = record_struct(sensor)
+            series = self._series[sensor] = [
+                _Series(str(self.root / series_name(sensor, window)), record, window, len(SCHEMAS[sensor]))
+                for window in self.windows
+            ]
+        return series
+
+    def add(self, sensor, readings):
+        # Returns {window: readings too late for it} for this batch.
+        late = {}
+        for series in self._series_for(sensor):
+            records = []
+            before = series.late
+            for timestamp, values in readings:
+                records.extend(series.pack(start) for start in series.add(timestamp, values))
+            if records:
+                self.writer.write(series.name, b"".join(records))
+            if series.late > before:
+                late[series.window] = series.late - before
+        return late
+
+    def close(self):
+        for all_series in self._series.values():
+            for series in all_series:
+                records = [series.pack(start) for start in sorted(series.buckets)]
+                if records:
+                    self.writer.write(series.name, b"".join(records))
+                self.writer.release(series.name)
+        self._series.clear()
+
+
+def read_rollups(path, sensor, start, end):
+    # Rollup records with start <= window start <= end from one series file,
+    # as dicts. Records are in window order, so the first one is found by
+    # binary search. Blocking.
+    record = record_struct(sensor)
+    path = Path(path)
+    if not path.exists():
+        return []
+    rows = []
+    with open(path, "rb") as f:
+        low, high = 0, path.stat().st_size // record.size
+        count = high
+        while low < high:
+            middle = (low + high) // 2
+            f.seek(middle * record.size)
+            if RECORD_HEAD.unpack(f.read(RECORD_HEAD.size))[0] < start:
+                low = middle + 1
+            else:
+                high = middle
+        f.seek(low * record.size)
+        for _ in range(low, count):
+            values = record.unpack(f.read(record.size))
+            if values[0] > end:
+                break
+            row = {"Timestamp": values[0], "Count": values[1]}
+            for j, field in enumerate(SCHEMAS[sensor]):
+                row[f"{field}_min"], row[f"{field}_max"], row[f"{field}_mean"] = values[2 + 3 * j:5 + 3 * j]
+            rows.append(row)
+    return rows
@@ -0,0 +1,176 @@
+import gzip
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+
+MAX_BYTES = 64 * 1024 * 1024  # seal a file once it would grow past this (0 = no limit)
+MAX_AGE = 24 * 3600  # or once it has been written to for this many seconds (0 = no limit)
+RETENTION_BYTES = 0  # delete the oldest sealed files beyond this total (0 = keep all)
+COMPRESS_SUFFIXES = (".txt",)  # sealed files worth gzipping; audio is already compact
+
+_STAMP = "%Y%m%dT%H%M%S"
+# accelerometer.20261018T120000123.txt[.gz], audio.20261018T120000123.3gp, audio_0001.wav
+_SEALED = re.compile(r"^(?P<stem>.+)\.(?P<stamp>\d{8}T\d{9})(?P<suffix>\.[^.]+)?(?P<gz>\.gz)?$")
+_WAV = re.compile(r"^.+_\d{4,}\.wav$")
+
+log = logging.getLogger(__name__)
+
+
+def sealed_name(name, now=None):
+    # "devices/a/accelerometer.txt" -> "devices/a/accelerometer.<UTC time, ms>.txt"
+    now = time.time() if now is None else now
+    path = PurePosixPath(name)
+    stamp = time.strftime(_STAMP, time.gmtime(now)) + f"{int(now * 1000) % 1000:03d}"
+    return str(path.with_name(f"{path.stem}.{stamp}{path.suffix}"))
+
+
+def sealed_files(directory, filename):
+    # Sealed (and possibly compressed) versions of `filename` in `directory`,
+    # oldest first.
+    stem, suffix = os.path.splitext(filename)
+    found = []
+    for path in Path(directory).glob(f"{stem}.*"):
+        match = _SEALED.match(path.name)
+        if match and match["stem"] == stem and (match["suffix"] or "") == suffix:
+            found.append((match["stamp"], path))
+    return [path for _, path in sorted(found)]
+
+
+class Rotation:
+    """Size/age based rotation policy plus background compression and retention.
+
+    The writers ask `due()` whether a file should be sealed before appending
+    to it, rename it to `sealed_name()` and start a fresh file, so ingest never
+    waits. They then report the sealed file through `sealed()`, which gzips it
+    (for COMPRESS_SUFFIXES) and enforces the retention budget on a background
+    thread. `limits` maps a file name (e.g. "gyroscope.txt") to its own
+    (max_bytes, max_age). Each of `companions`, called with a sealed file's
+    path, returns a path that retention deletes along with it (e.g. its index).
+    """
+
+    def __init__(self, root, max_bytes=MAX_BYTES, max_age=MAX_AGE, retention_bytes=RETENTION_BYTES,
+                 compress_suffixes=COMPRESS_SUFFIXES, limits=None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retention_bytes = retention_bytes
+        self.compress_suffixes = tuple(compress_suffixes)
+        self.limits = dict(limits or {})
+        self.companions = []
+
+        self.sealed_count = 0
+        self.compressed = 0
+        self.deleted = 0
+        self.sealed_bytes = 0
+
+        self._files = {}  # path -> (size, sealed at), everything retention may delete
+        self._lock = threading.Lock()
+        self._direct = {}  # path -> [size, started] for files appended outside the writer
+        self._executor = None
+
+    def limits_for(self, name):
+        return self.limits.get(PurePosixPath(name).name, (self.max_bytes, self.max_age))
+
+    def due(self, name, size, started, incoming=0):
+        max_bytes, max_age = self.limits_for(name)
+        if not size:
+            return False
+        if max_bytes and size + incoming > max_bytes:
+            return True
+        return bool(max_age) and time.monotonic() - started >= max_age
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rotation")
+        self._executor.submit(self._scan)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def sealed(self, path):
+        # Called (from any thread) once `path` is complete and won't change.
+        self.sealed_count += 1
+        if self._executor is not None:
+            self._executor.submit(self._archive, Path(path))
+
+    def rotate_file_if_due(self, path, incoming):
+        # For files appended to directly rather than through the writer (the
+        # /pro/audio 3GP stream). Cheap: one stat the first time a path is seen.
+        path = Path(path)
+        state = self._direct.get(path)
+        if state is None:
+            size = path.stat().st_size if path.exists() else 0
+            state = self._direct[path] = [size, time.monotonic()]
+        if self.due(path.name, state[0], state[1], incoming):
+            sealed = path.with_name(Path(sealed_name(path.name)).name)
+            os.replace(path, sealed)
+            self.sealed(sealed)
+            state[:] = [0, time.monotonic()]
+        state[0] += incoming
+
+    # Everything below runs on the rotation thread.
+
+    def _archive(self, path):
+        try:
+            if path.suffix in self.compress_suffixes and path.exists():
+                path = self._compress(path)
+            with self._lock:
+                self._files[path] = (path.stat().st_size, time.time())
+            self._enforce()
+        except OSError as e:
+            log.error("[rotation] Error archiving %s: %s", path, e)
+
+    def _compress(self, path):
+        target = path.with_name(path.name + ".gz")
+        partial = path.with_name(path.name + ".gz.partial")
+        with open(path, "rb") as src, gzip.open(partial, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(partial, target)
+        os.remove(path)
+        self.compressed += 1
+        log.debug("[rotation] Compressed %s", target)
+        return target
+
+    def _scan(self):
+        # Pick up sealed files (and finished WAVs) from previous runs; finish
+        # compressions a crash interrupted. Files touched since we started
+        # belong to this run and are reported through sealed().
+        started = time.time()
+        for path in self.root.rglob("*"):
+            if path.name.endswith(".gz.partial"):
+                path.unlink(missing_ok=True)
+                continue
+            if not (_SEALED.match(path.name) or _WAV.match(path.name)) or not path.is_file():
+                continue
+            if path.stat().st_mtime >= started:
+                continue
+            if path.suffix in self.compress_suffixes:
+                self._archive(path)
+            else:
+                with self._lock:
+                    self._files[path] = (path.stat().st_size, path.stat().st_mtime)
+        self._enforce()
+
+    def _enforce(self):
+        with self._lock:
+            self.sealed_bytes = sum(size for size, _ in self._files.values())
+            if not self.retention_bytes or self.sealed_bytes <= self.retention_bytes:
+                return
+            oldest = sorted(self._files.items(), key=lambda item: item[1][1])
+        for path, (size, _) in oldest:
+            if self.sealed_bytes <= self.retention_bytes:
+                break
+            path.unlink(missing_ok=True)
+            for companion in self.companions:
+                companion(path).unlink(missing_ok=True)
+            with self._lock:
+                del self._files[path]
+                self.sealed_bytes -= size
+            self.deleted += 1
+            log.info("[rotation] Retention: deleted %s", path)
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import queue
+import sys
+import time
+from collections import defaultdict
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_EVERY = 0  # log every Nth payload per endpoint (0 = off, 1 = everything)
+LOG_INTERVAL = 1.0  # and/or at most one payload per endpoint per interval (0 = off)
+SUMMARY_INTERVAL = 10.0  # seconds between rate summary lines
+QUEUE_SIZE = 10_000  # log records held for the console before we start dropping
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Hands records to the listener thread; never blocks, drops when full.
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level=logging.INFO, stream=None, prefix=""):
+    """Route all logging through a background thread.
+
+    Handlers only put records on a bounded queue; a QueueListener thread does
+    the actual (possibly slow) console writes. Returns the handler and the
+    listener, which should be stopped on shutdown to flush what is left.
+    """
+    records = queue.Queue(QUEUE_SIZE)
+    console = logging.StreamHandler(stream or sys.stdout)
+    console.setFormatter(logging.Formatter(prefix + "%(message)s"))
+    handler = DroppingQueueHandler(records)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers[:] = [handler]
+
+    listener = QueueListener(records, console)
+    listener.start()
+    return handler, listener
+
+
+class PayloadLog:
+    """Sampled per-endpoint payload logging plus periodic rate summaries.
+
+    `message()` is called for every message but only formats and emits a log
+    line for every `every`th message or once per `interval` seconds per
+    endpoint. Counts are kept for all of them and reported by `summary()`.
+    Left out, they are LOG_EVERY and LOG_INTERVAL as set when the PayloadLog
+    is created.
+    """
+
+    def __init__(self, logger, every=None, interval=None):
+        self.logger = logger
+        self.every = LOG_EVERY if every is None else every
+        self.interval = LOG_INTERVAL if interval is None else interval
+        self.counts = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self._last_logged = {}
+        self._summary_sources = []
+        self._window_start = time.monotonic()
+        self._window_counts = {}
+        self._window_bytes = {}
+
+    def add_summary_source(self, source):
+        # `source()` returns a short string appended to each summary line.
+        self._summary_sources.append(source)
+
+    def message(self, endpoint, payload, size=None):
+        count = self.counts[endpoint] = self.counts[endpoint] + 1
+        self.bytes[endpoint] += len(payload) if size is None else size
+
+        log = self.every and count % self.every == 0
+        if not log and self.interval:
+            now = time.monotonic()
+            if now - self._last_logged.get(endpoint, 0.0) >= self.interval:
+                self._last_logged[endpoint] = now
+                log = True
+        if log:
+            self.logger.info("[%s] %s", endpoint, payload)
+
+    def summary(self):
+        now = time.monotonic()
+        elapsed = max(now - self._window_start, 1e-9)
+        parts = []
+        for endpoint in sorted(self.counts):
+            messages = self.counts[endpoint] - self._window_counts.get(endpoint, 0)
+            size = self.bytes[endpoint] - self._window_bytes.get(endpoint, 0)
+            parts.append(f"{endpoint} {messages / elapsed:.1f} msg/s {size / elapsed / 1024:.1f} KiB/s")
+        parts.extend(source() for source in self._summary_sources)
+
+        self._window_start = now
+        self._window_counts = dict(self.counts)
+        self._window_bytes = dict(self.bytes)
+        return " | ".join(parts) if parts else "idle"
+
+    async def run_summaries(self, interval=None):
+        interval = SUMMARY_INTERVAL if interval is None else interval
+        while True:
+            await asyncio.sleep(interval)
+            self.logger.info("[summary] %s", self.summary())
@@ -1,12 +1,34 @@
 #!/usr/bin/env python3
 
+import argparse
 import asyncio
+import multiprocessing
+import multiprocessing.connection
+import signal
 import websockets
 import socket
 from base64 import b64decode
-import wave
 import json
+import logging
+import os
+import queue
+import time
 from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import binary_frames
+import camera
+import metrics
+import pubsub
+from columnar import SCHEMAS, parse_reading
+from envelopes import split_envelope
+from devices import DEFAULT_DEVICE, DeviceRegistry, device_file, parse_handshake, split_device, valid_device_id
+from sampled_log import PayloadLog, setup_logging
+from rollups import read_rollups, series_name
+from rotation import Rotation
+from time_index import TimeIndexes, index_path, open_lines, read_lines, read_range, sealed_sources
+from wav_sink import MAX_BYTES as MAX_WAV_BYTES, WavSink
+from writer import BufferedWriter
 
 PORT = 5000
 DATA_DIR = Path("data")
@@ -24,6 +46,81 @@ TEXT_ENDPOINTS = {
     "/proximity": "proximity.txt",
     "/geolocation": "geolocation.txt",
 }
+TEXT_PATHS = {name: path for path, name in TEXT_ENDPOINTS.items()}
+STREAM_ENDPOINTS = ("/camera", "/audio", "/pro/audio")
+
+# Prometheus metrics are served at http://METRICS_HOST:METRICS_PORT/metrics.
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 5001
+
+# Payloads are logged for a sample of messages only (see sampled_log.py for
+# LOG_EVERY / LOG_INTERVAL), plus a rate summary every SUMMARY_INTERVAL seconds.
+SUMMARY_INTERVAL = 10.0
+
+log = logging.getLogger("server")
+payload_log = PayloadLog(log)
+
+# How sensor readings are stored: "text" keeps the raw JSON lines, "columnar"
+# parses them into typed column files under DATA_DIR/columnar (sensors without
+# a fixed schema still go to text), "both" does both.
+STORAGE_MODE = "text"
+
+# Min/max/mean of every field of the sensors in SCHEMAS over these windows
+# (seconds) are kept at ingest and written to DATA_DIR/rollups/<sensor>/<N>s.bin,
+# readable with /query?...&resolution=N. () turns rollups off.
+ROLLUP_WINDOWS = (1, 60)
+# Store only every Nth raw reading of a sensor, e.g. {"accelerometer": 10}.
+# Rollups and /subscribe still see every reading.
+RAW_DECIMATE = {}
+
+# Text readings are queued in memory and flushed to DATA_DIR in batches.
+text_writer = BufferedWriter(DATA_DIR)
+# Phones that identify themselves (/device/<id>/<sensor>, ?device=<id>, or a
+# first {"DeviceId": ...} message) get their own files under DATA_DIR/devices/<id>/.
+device_registry = DeviceRegistry(text_writer, ROLLUP_WINDOWS)
+# Devices offline for SESSION_IDLE seconds have their buffered data written out,
+# their files closed and their session dropped; they start a new one on return.
+SESSION_IDLE = 300.0
+# Sparse timestamp -> byte offset index over each text file, for /query.
+text_indexes = TimeIndexes(text_writer)
+
+# Text logs, /pro/audio streams and /audio WAVs are sealed (renamed with a UTC
+# timestamp) once they reach ROTATE_BYTES or have been written to for
+# ROTATE_SECONDS, and a fresh file is started. Sealed text files are gzipped in
+# the background; once sealed files add up to more than RETENTION_BYTES the
+# oldest are deleted. 0 disables a limit. ROTATE_LIMITS overrides the limits
+# per file, e.g. {"gyroscope.txt": (16 * 1024 * 1024, 3600)}.
+ROTATE_BYTES = 64 * 1024 * 1024
+ROTATE_SECONDS = 24 * 3600
+RETENTION_BYTES = 0
+ROTATE_LIMITS = {}
+rotation = Rotation(DATA_DIR, ROTATE_BYTES, ROTATE_SECONDS, RETENTION_BYTES, limits=ROTATE_LIMITS)
+rotation.companions.append(lambda path: index_path(text_writer.root, path))
+text_writer.rotation = rotation
+
+# Live readings for /subscribe consumers. Each subscriber gets a bounded queue
+# that coalesces when it falls behind, so slow consumers never hold up ingest.
+broker = pubsub.Broker()
+
+# Index of this process under --workers, None when running as a single server.
+WORKER = None
+# How long --workers waits for all workers to start listening.
+WORKER_START_TIMEOUT = 60.0
+
+# Camera frames are decoded and saved on a small thread pool behind a bounded
+# queue. When it is full, drop the "oldest" queued frame or the "newest" one.
+# CAMERA_STORAGE "files" writes one {Timestamp}.png per frame; "archive"
+# appends frames to segment files under frames/ (see frame_archive.py).
+CAMERA_WORKERS = 2
+CAMERA_QUEUE_SIZE = 8
+CAMERA_DROP_POLICY = camera.DROP_OLDEST
+CAMERA_STORAGE = "files"
+camera_pipeline = camera.CameraPipeline(
+    camera.archive_frame if CAMERA_STORAGE == "archive" else camera.save_frame,
+    workers=CAMERA_WORKERS,
+    queue_size=CAMERA_QUEUE_SIZE,
+    drop_policy=CAMERA_DROP_POLICY,
+)
 
 
 def get_ip():
@@ -37,103 +134,571 @@ def get_ip():
         s.close()
 
 
-async def handle_text_sensor(path, message):
-    file_path = DATA_DIR / TEXT_ENDPOINTS[path]
-    with open(file_path, "a") as f:
-        f.write(message + "\n")
-    print(f"[{path}] {message}")
+def metric_path(name):
+    # Endpoint label for a file written through text_writer, for any device.
+    parts = Path(name).parts
+    if parts[0] == "devices":
+        parts = parts[2:]
+    if parts[0] == "columnar":
+        return f"/{parts[1]}"
+    return TEXT_PATHS.get(parts[-1], parts[-1])
 
 
-async def handle_camera(message):
-    try:
-        payload = json.loads(message)
-        timestamp = payload["Timestamp"]
-        image_data = b64decode(payload["Base64Data"])
-
-        filename = DATA_DIR / f"{timestamp}.png"
-        with open(filename, "wb") as f:
-            f.write(image_data)
+def record_persisted(name, stamps):
+    now = time.time()
+    metrics.PERSIST_LATENCY.observe_many([now - stamp / 1000 for stamp in stamps], metric_path(name))
 
-        print(f"[camera] Saved image {filename}")
 
-    except Exception as e:
-        print(f"[camera] Error: {e}")
+async def load_index(session, path):
+    # Load this connection's text file index off the event loop before its
+    # first reading is indexed: for an older file without an index that is a
+    # scan of the whole file.
+    if path in TEXT_ENDPOINTS:
+        name = session.file(TEXT_ENDPOINTS[path])
+        await asyncio.get_running_loop().run_in_executor(None, text_indexes.get, name)
 
 
-async def handle_audio(message):
+def parse_or_none(path, sensor, reading):
     try:
-        pcm_data = b64decode(message)
-
-        pcm_file = DATA_DIR / "temp.pcm"
-        wav_file = DATA_DIR / "audio.wav"
-
-        with open(pcm_file, "ab") as f:
-            f.write(pcm_data)
-
-        with open(pcm_file, "rb") as pcm:
-            pcm_data = pcm.read()
-
-        with wave.open(str(wav_file), "wb") as wav:
-            wav.setnchannels(1)
-            wav.setsampwidth(2)
-            wav.setframerate(48000)
-            wav.writeframes(pcm_data)
-
-        print("[audio] Wrote audio.wav")
+        return parse_reading(sensor, reading)
+    except Exception as e:
+        log.error("[%s] Dropped bad reading: %s", path, e)
+        return None
+
+
+async def handle_text_sensor(session, path, message):
+    # One reading, or a batch of them (a JSON array or newline-delimited
+    # JSON) handled in one go: one parse, one columnar extend, one write.
+    if not isinstance(message, str):
+        log.warning("[%s] Rejected binary frame (%d bytes): sensor readings must be JSON text", path, len(message))
+        return
+    started = time.perf_counter()
+    sensor = path[1:]
+    columnar = STORAGE_MODE != "text" and sensor in SCHEMAS
+    try:
+        lines, readings = split_envelope(message)
+    except ValueError as e:
+        log.error("[%s] Bad batch: %s", path, e)
+        return
+    count = len(lines)
+    if not count:
+        return
+
+    # Parsed readings line up with `lines`. A bad one is dropped everywhere
+    # (storage, rollups, subscribers) without losing the rest of its batch.
+    parsed = None
+    if sensor in SCHEMAS:
+        parsed = [parse_or_none(path, sensor, reading) for reading in readings or lines]
+    # Decode time covers splitting and parsing only, not indexing or writes.
+    metrics.DECODE_SECONDS.observe(time.perf_counter() - started, path)
+    if parsed is not None:
+        bad = parsed.count(None)
+        if bad:
+            metrics.BAD_READINGS.inc(path, amount=bad)
+            kept = [(line, reading) for line, reading in zip(lines, parsed) if reading is not None]
+            lines = [line for line, _ in kept]
+            parsed = [reading for _, reading in kept]
+            if not lines:
+                return
+    if parsed and ROLLUP_WINDOWS:
+        late = session.rollups.add(sensor, parsed)
+        for window, n in late.items():
+            metrics.ROLLUP_LATE.inc(f"{window}s", amount=n)
+    for line in lines:
+        broker.publish(sensor, session.device_id, line)
+    metrics.READINGS.inc(path, amount=len(lines))
+
+    every = RAW_DECIMATE.get(sensor, 1)
+    if every > 1:
+        seen = session.raw_seen.get(sensor, 0)
+        session.raw_seen[sensor] = seen + len(lines)
+        first = -seen % every
+        lines = lines[first::every]
+        parsed = parsed and parsed[first::every]
+
+    if columnar and parsed:
+        session.columnar.extend(sensor, parsed)
+
+    if lines and (not columnar or STORAGE_MODE == "both"):
+        name = session.file(TEXT_ENDPOINTS[path])
+        encoded = [(line + "\n").encode() for line in lines]
+        text_writer.rotate_if_due(name, sum(map(len, encoded)))
+        stamps = [t for t in (text_indexes.observe(name, line) for line in encoded) if t is not None]
+        text_writer.write(name, encoded[0] if len(encoded) == 1 else b"".join(encoded), stamps)
+    payload_log.message(path, message if count == 1 else f"Batch of {count} readings", len(message))
+
+
+async def handle_camera(session, message):
+    if not isinstance(message, str):
+        # Checked here, so frames that would be rejected don't take queue slots.
+        try:
+            binary_frames.unpack(message, binary_frames.ENDPOINT_FORMATS["/camera"])
+        except ValueError as e:
+            log.warning("[camera] Rejected binary frame (%d bytes): %s", len(message), e)
+            return
+    payload_log.message("/camera", f"Received frame ({len(message)} bytes)", len(message))
+    target = session.frames if CAMERA_STORAGE == "archive" else session.root
+    if not camera_pipeline.submit(target, message):
+        log.debug("[camera] Queue full, dropped frame (%d so far)", camera_pipeline.dropped)
+
+
+def decode_media(path, message):
+    # (timestamp, raw bytes) of a media message: base64 text from older apps
+    # (no timestamp, None), or a binary frame whose payload is passed on as a
+    # memoryview, without copying. Raises ValueError for a binary frame in a
+    # format `path` doesn't store.
+    if isinstance(message, str):
+        return None, b64decode(message)
+    _, timestamp, payload = binary_frames.unpack(message, binary_frames.ENDPOINT_FORMATS[path])
+    return timestamp, payload
+
+
+def record_media_persisted(timestamp, path):
+    if timestamp is not None:
+        metrics.PERSIST_LATENCY.observe(time.time() - timestamp / 1000, path)
+
+
+async def handle_audio(sink, message):
+    started = time.perf_counter()
+    try:
+        timestamp, pcm = decode_media("/audio", message)
+    except ValueError as e:
+        log.warning("[audio] Rejected frame (%d bytes): %s", len(message), e)
+        return
+    try:
+        decoded = time.perf_counter()
+        sink.write(pcm)
+        metrics.DECODE_SECONDS.observe(decoded - started, "/audio")
+        metrics.WRITE_SECONDS.observe(time.perf_counter() - decoded, "audio")
+        record_media_persisted(timestamp, "/audio")
+        payload_log.message("/audio", f"Appended to {sink.path.name}", len(message))
 
     except Exception as e:
-        print(f"[audio] Error: {e}")
+        log.error("[audio] Error: %s", e)
 
 
-async def handle_pro_audio(message):
+async def handle_pro_audio(session, message):
+    started = time.perf_counter()
     try:
-        audio_data = b64decode(message)
-        with open(DATA_DIR / "audio.3gp", "ab") as f:
+        timestamp, audio_data = decode_media("/pro/audio", message)
+    except ValueError as e:
+        log.warning("[pro/audio] Rejected frame (%d bytes): %s", len(message), e)
+        return
+    try:
+        decoded = time.perf_counter()
+        session.root.mkdir(parents=True, exist_ok=True)
+        path = session.root / "audio.3gp"
+        rotation.rotate_file_if_due(path, len(audio_data))
+        with open(path, "ab") as f:
             f.write(audio_data)
-        print("[pro/audio] Appended audio data")
+        metrics.DECODE_SECONDS.observe(decoded - started, "/pro/audio")
+        metrics.WRITE_SECONDS.observe(time.perf_counter() - decoded, "pro/audio")
+        record_media_persisted(timestamp, "/pro/audio")
+        payload_log.message("/pro/audio", "Appended audio data", len(message))
 
     except Exception as e:
-        print(f"[pro/audio] Error: {e}")
+        log.error("[pro/audio] Error: %s", e)
+
+
+async def handle_query(websocket, params):
+    # /query?sensor=accelerometer&start=T1&end=T2&step=N[&device=ID] streams
+    # back the stored text readings with T1 <= Timestamp <= T2, keeping every
+    # Nth one, then closes the connection. With &resolution=S it sends the
+    # S-second rollup records in that range instead.
+    if WORKER is not None:
+        # This worker's shard holds only the connections it accepted.
+        await websocket.send(json.dumps({"error": "/query is not available with --workers"}))
+        return
+    try:
+        sensor = params["sensor"][0]
+        device_id = params.get("device", [DEFAULT_DEVICE])[0]
+        if not valid_device_id(device_id):
+            raise ValueError(f"invalid device id {device_id!r}")
+        name = device_file(device_id, TEXT_ENDPOINTS[f"/{sensor}"])
+        start = int(params.get("start", ["0"])[0])
+        end = int(params.get("end", [str(2**63 - 1)])[0])
+        step = max(1, int(params.get("step", ["1"])[0]))
+        resolution = int(params["resolution"][0]) if "resolution" in params else None
+        if resolution is not None and (resolution not in ROLLUP_WINDOWS or sensor not in SCHEMAS):
+            raise ValueError(f"no {resolution}s rollups for {sensor}")
+    except (KeyError, ValueError) as e:
+        await websocket.send(json.dumps({"error": f"Bad query: {e}"}))
+        return
+
+    if resolution is not None:
+        await text_writer.flush()
+        path = text_writer.root / device_file(device_id, "rollups") / series_name(sensor, resolution)
+        rows = await asyncio.get_running_loop().run_in_executor(None, read_rollups, path, sensor, start, end)
+        for row in rows[::step]:
+            await websocket.send(json.dumps(row))
+        log.info("[query] Sent %d %ds %s rollups from %d to %d", len(rows[::step]), resolution, sensor, start, end)
+        return
+
+    if STORAGE_MODE == "columnar" and sensor in SCHEMAS:
+        await websocket.send(json.dumps({"error": f"{sensor} is stored in columnar mode"}))
+        return
+
+    # Make sure everything received so far is on disk before reading it back.
+    await text_writer.flush()
+    root = text_writer.root
+    loop = asyncio.get_running_loop()
+    index = await loop.run_in_executor(None, text_indexes.get, name)
+    ranges = index.ranges(start, end)
+    matched = sent = 0
+
+    async def send(lines):
+        nonlocal matched, sent
+        for line in lines:
+            if matched % step == 0:
+                await websocket.send(line.decode())
+                sent += 1
+            matched += 1
+
+    # Sealed files first (oldest first), then the live one.
+    for path, sealed_ranges in await loop.run_in_executor(None, sealed_sources, root, name, start, end):
+        try:
+            if sealed_ranges is not None:
+                for offset, length in sealed_ranges:
+                    await send(await loop.run_in_executor(None, read_range, path, offset, length, start, end))
+                continue
+            # Compressed: stream through it a chunk at a time.
+            f = await loop.run_in_executor(None, open_lines, path)
+            try:
+                done = False
+                while not done:
+                    lines, done = await loop.run_in_executor(None, read_lines, f, start, end)
+                    await send(lines)
+            finally:
+                f.close()
+        except FileNotFoundError:
+            pass  # compressed or expired while we were reading; skip it
+
+    for offset, length in ranges:
+        await send(await loop.run_in_executor(None, read_range, root / name, offset, length, start, end))
+
+    log.info("[query] Sent %d %s readings from %d to %d", sent, sensor, start, end)
+
+
+async def handle_subscribe(websocket, params):
+    # /subscribe?topics=accelerometer,gyroscope[&device=ID][&mode=latest|decimate]
+    # streams readings as they arrive, until the consumer disconnects.
+    if WORKER is not None:
+        # Each worker only sees the phones the kernel handed to it, so a
+        # subscription here would silently miss readings.
+        await websocket.send(json.dumps({"error": "/subscribe is not available with --workers"}))
+        return
+    try:
+        topics = [topic for value in params["topics"] for topic in value.split(",") if topic]
+        unknown = [topic for topic in topics if f"/{topic}" not in TEXT_ENDPOINTS]
+        if not topics or unknown:
+            raise ValueError(f"unknown topics {unknown}")
+        subscription = pubsub.Subscription(
+            topics,
+            device_id=params.get("device", [None])[0],
+            mode=params.get("mode", [pubsub.DECIMATE])[0],
+        )
+    except (KeyError, ValueError) as e:
+        await websocket.send(json.dumps({"error": f"Bad subscription: {e}"}))
+        return
+
+    async def send():
+        try:
+            while True:
+                for message in await subscription.get():
+                    await websocket.send(message)
+        except websockets.ConnectionClosed:
+            pass
+
+    broker.subscribe(subscription)
+    sender = asyncio.create_task(send())
+    try:
+        # Nothing is expected from the consumer; this returns when it disconnects.
+        async for _ in websocket:
+            pass
+    finally:
+        sender.cancel()
+        broker.unsubscribe(subscription)
+        log.info(
+            "[subscribe] %s done: %d delivered, %d coalesced",
+            ",".join(sorted(subscription.topics)), subscription.delivered, subscription.coalesced,
+        )
 
 
 async def websocket_handler(websocket, path=None):
     # websockets >= 14 calls the handler with only `websocket` and exposes the
-    # path via websocket.request.path. Older versions pass `path` directly.
+    # path via websocket.request.path. Older versions pass `path` directly, or
+    # (10.1+, single-argument handlers) expose it as websocket.path.
     if path is None:
-        path = websocket.request.path
-
-    print(f"Client connected to {path}")
-
-    async for message in websocket:
-
-        if path in TEXT_ENDPOINTS:
-            await handle_text_sensor(path, message)
-
-        elif path == "/camera":
-            await handle_camera(message)
-
-        elif path == "/audio":
-            await handle_audio(message)
+        request = getattr(websocket, "request", None)
+        path = request.path if request is not None else websocket.path
+
+    url = urlsplit(path)
+    params = parse_qs(url.query)
+    if url.path == "/query":
+        log.info("Client connected to %s", path)
+        await handle_query(websocket, params)
+        return
+    if url.path == "/subscribe":
+        log.info("Client connected to %s", path)
+        await handle_subscribe(websocket, params)
+        return
+
+    path, device_id = split_device(url.path, params)
+    if path not in TEXT_ENDPOINTS and path not in STREAM_ENDPOINTS:
+        log.warning("Unknown endpoint: %s", url.path)
+        return
+    if device_id is not None and not valid_device_id(device_id):
+        log.warning("Rejected invalid device id %r on %s", device_id, path)
+        return
+
+    # Without an id in the URL, the first message may be a handshake.
+    session = device_registry.connect(device_id, path) if device_id is not None else None
+    log.info("Client connected to %s (device %s)", path, device_id or "pending")
+    audio_sink = None
 
-        elif path == "/pro/audio":
-            await handle_pro_audio(message)
-
-        else:
-            print(f"Unknown endpoint: {path}")
-
-
-async def main():
-    ip = get_ip()
-    print(f"Server running at ws://{ip}:{PORT}")
+    try:
+        if session is not None:
+            await load_index(session, path)
+        async for message in websocket:
+            metrics.MESSAGES.inc(path)
+            metrics.RECEIVED_BYTES.inc(path, amount=len(message))
+
+            if session is None:
+                device_id, handshake_only = parse_handshake(message)
+                if device_id is None or not valid_device_id(device_id):
+                    device_id = DEFAULT_DEVICE
+                session = device_registry.connect(device_id, path)
+                await load_index(session, path)
+                if handshake_only:
+                    log.info("Device %s identified on %s", device_id, path)
+                    continue
+            session.messages += 1
+
+            if path in TEXT_ENDPOINTS:
+                await handle_text_sensor(session, path, message)
+
+            elif path == "/camera":
+                await handle_camera(session, message)
+
+            elif path == "/audio":
+                # Each /audio connection records into its own numbered WAV file.
+                if audio_sink is None:
+                    audio_sink = WavSink(session.root, max_bytes=ROTATE_BYTES or MAX_WAV_BYTES,
+                                         max_seconds=ROTATE_SECONDS, on_sealed=rotation.sealed)
+                await handle_audio(audio_sink, message)
+
+            elif path == "/pro/audio":
+                await handle_pro_audio(session, message)
 
-    async with websockets.serve(
-        websocket_handler,
-        "0.0.0.0",
-        PORT,
-        max_size=1_000_000_000
-    ):
-        await asyncio.Future()  # run forever
+    finally:
+        if audio_sink is not None:
+            audio_sink.close()
+        if session is not None:
+            device_registry.disconnect(session, path)
+
+
+async def evict_idle_sessions():
+    while True:
+        await asyncio.sleep(SESSION_IDLE / 4)
+        sessions = device_registry.evict_idle(SESSION_IDLE)
+        if not sessions:
+            continue
+        names = [session.file(name) for session in sessions for name in TEXT_ENDPOINTS.values()]
+        for name in names:
+            text_writer.release(name)
+        await text_writer.flush()
+        for session in sessions:
+            if session.device_id not in device_registry.sessions:  # unless it is back already
+                for name in TEXT_ENDPOINTS.values():
+                    text_indexes.forget(session.file(name))
+        log.info("Dropped %d idle device session(s)", len(sessions))
+
+
+def writer_summary():
+    lag = text_writer.lag()
+    return f"writer backlog {lag['records']} records {lag['seconds']:.1f}s"
+
+
+def devices_summary():
+    return f"devices online {device_registry.online()}/{len(device_registry.sessions)}"
+
+
+def camera_summary():
+    return (
+        f"camera processed {camera_pipeline.processed} dropped {camera_pipeline.dropped} "
+        f"queued {camera_pipeline.depth()}"
+    )
+
+
+def rotation_summary():
+    return (
+        f"rotation sealed {rotation.sealed_count} compressed {rotation.compressed} "
+        f"deleted {rotation.deleted} archived {rotation.sealed_bytes / 2**20:.1f} MiB"
+    )
+
+
+def subscribers_summary():
+    return f"subscribers {len(broker.subscriptions)} coalesced {broker.dropped()}"
+
+
+def register_metrics(log_handler):
+    text_writer.on_persisted = record_persisted
+    metrics.QUEUE_DEPTH.set_function(lambda: text_writer.lag()["records"], "writer")
+    metrics.QUEUE_LAG.set_function(lambda: text_writer.lag()["seconds"], "writer")
+    metrics.QUEUE_DEPTH.set_function(camera_pipeline.depth, "camera")
+    metrics.DROPPED.set_function(lambda: camera_pipeline.dropped, "camera")
+    metrics.DROPPED.set_function(lambda: log_handler.dropped, "log")
+    metrics.QUEUE_DEPTH.set_function(broker.depth, "subscribers")
+    metrics.DROPPED.set_function(broker.dropped, "subscribers")
+    metrics.DEVICES.set_function(device_registry.online)
+    metrics.ROTATED_FILES.set_function(lambda: rotation.sealed_count, "sealed")
+    metrics.ROTATED_FILES.set_function(lambda: rotation.compressed, "compressed")
+    metrics.ROTATED_FILES.set_function(lambda: rotation.deleted, "deleted")
+    metrics.ARCHIVED_BYTES.set_function(lambda: rotation.sealed_bytes)
+
+
+def reuseport_socket(port):
+    # Every worker binds its own listening socket to the same port; the kernel
+    # spreads incoming connections across them.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("0.0.0.0", port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+async def main(sock=None, ready=None, log_prefix=""):
+    log_handler, log_listener = setup_logging(prefix=log_prefix)
+    payload_log.add_summary_source(writer_summary)
+    payload_log.add_summary_source(camera_summary)
+    payload_log.add_summary_source(devices_summary)
+    payload_log.add_summary_source(subscribers_summary)
+    payload_log.add_summary_source(rotation_summary)
+    payload_log.add_summary_source(lambda: f"log records dropped {log_handler.dropped}")
+    register_metrics(log_handler)
+
+    if sock is None:
+        log.info("Server running at ws://%s:%d", get_ip(), PORT)
+
+    # Bring the text file indexes up to date before accepting data.
+    loop = asyncio.get_running_loop()
+    for name in TEXT_ENDPOINTS.values():
+        await loop.run_in_executor(None, text_indexes.get, name)
+
+    await text_writer.start()
+    rotation.start()
+    await camera_pipeline.start()
+    summaries = asyncio.create_task(payload_log.run_summaries(SUMMARY_INTERVAL))
+    evictions = asyncio.create_task(evict_idle_sessions())
+    metrics_server = await metrics.serve(METRICS_HOST, METRICS_PORT)
+
+    # Ctrl-C and SIGTERM both shut down cleanly, flushing everything queued.
+    # Workers ignore Ctrl-C and wait for the supervisor's SIGTERM.
+    stop = loop.create_future()
+    for signum in (signal.SIGINT, signal.SIGTERM) if WORKER is None else (signal.SIGTERM,):
+        try:
+            loop.add_signal_handler(signum, lambda: stop.done() or stop.set_result(None))
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: KeyboardInterrupt still works
+
+    listen = {"sock": sock} if sock is not None else {"host": "0.0.0.0", "port": PORT}
+    try:
+        async with websockets.serve(
+            websocket_handler,
+            max_size=1_000_000_000,
+            **listen
+        ):
+            if ready is not None:
+                ready.put(os.getpid())
+            await stop  # run until told to stop
+    finally:
+        summaries.cancel()
+        evictions.cancel()
+        metrics_server.close()
+        await camera_pipeline.close()
+        for session in device_registry.sessions.values():
+            session.close()
+        await text_writer.close()
+        rotation.close()
+        log_listener.stop()
+
+
+def run_worker(index, ready):
+    global METRICS_PORT, WORKER
+    # Each worker owns its own storage shard and metrics port.
+    WORKER = index
+    text_writer.root = rotation.root = DATA_DIR / f"worker-{index}"
+    METRICS_PORT += index
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor coordinates shutdown
+    asyncio.run(main(reuseport_socket(PORT), ready, log_prefix=f"[worker {index}] "))
+
+
+def stop_workers(processes):
+    # SIGTERM, then give each worker time for its final flush.
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        process.join(timeout=30)
+        if process.is_alive():
+            process.kill()
+
+
+def supervise(workers):
+    # Start `workers` processes sharing PORT via SO_REUSEPORT, restart any that
+    # die, and on Ctrl-C/SIGTERM stop them all and wait for their final flush.
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise SystemExit("--workers needs SO_REUSEPORT (Linux or BSD)")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    ready = multiprocessing.Queue()
+
+    def start(index):
+        process = multiprocessing.Process(target=run_worker, args=(index, ready), name=f"worker-{index}")
+        process.start()
+        return process
+
+    processes = {index: start(index) for index in range(workers)}
+    deadline = time.monotonic() + WORKER_START_TIMEOUT
+    started = 0
+    while started < workers:
+        try:
+            ready.get(timeout=0.5)
+            started += 1
+        except queue.Empty:
+            failed = [(index, p.exitcode) for index, p in processes.items() if p.exitcode is not None]
+            if failed or time.monotonic() > deadline:
+                stop_workers(processes)
+                if failed:
+                    raise SystemExit("Worker %d exited with %s during startup" % failed[0])
+                raise SystemExit(f"Workers did not start within {WORKER_START_TIMEOUT:g}s")
+    log.info("Server running at ws://%s:%d with %d workers", get_ip(), PORT, workers)
+
+    stopping = []
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+
+    while not stopping:
+        multiprocessing.connection.wait([p.sentinel for p in processes.values()], timeout=0.5)
+        for index, process in list(processes.items()):
+            if not process.is_alive() and not stopping:
+                log.warning("Worker %d exited with %s, restarting", index, process.exitcode)
+                processes[index] = start(index)
+
+    log.info("Stopping %d workers", workers)
+    stop_workers(processes)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Sensor Stream WebSocket server")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="worker processes sharing the port via SO_REUSEPORT, each writing to data/worker-N",
+    )
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        supervise(args.workers)
+    else:
+        asyncio.run(main())
@@ -0,0 +1,241 @@
+import gzip
+import re
+import struct
+import threading
+from pathlib import Path, PurePosixPath
+
+from rotation import sealed_files
+
+STRIDE = 256  # lines per index block
+MAX_READ = 1024 * 1024  # never merge blocks into reads larger than this
+ENTRY = struct.Struct("<qqQQ")  # min timestamp, max timestamp, byte offset, byte length
+
+_TIMESTAMP = re.compile(rb'"Timestamp"\s*:\s*"?(-?\d+)')
+
+
+def index_name(name):
+    # Storage name of the index for data file `name`.
+    return str(PurePosixPath("index", f"{name}.idx"))
+
+
+def index_path(root, path):
+    # Index file of a sealed, possibly gzipped, data file under `root`.
+    path = Path(path)
+    if path.suffix == ".gz":
+        path = path.with_suffix("")
+    return Path(root) / index_name(path.relative_to(root).as_posix())
+
+
+def read_entries(path):
+    raw = Path(path).read_bytes()
+    return list(ENTRY.iter_unpack(raw[:len(raw) - len(raw) % ENTRY.size]))
+
+
+def merge_ranges(blocks, start, end):
+    # Byte ranges (offset, length) of the blocks that may hold readings in
+    # [start, end], with adjacent ones merged up to MAX_READ.
+    ranges = []
+    for low, high, offset, length in blocks:
+        if high < start or low > end:
+            continue
+        if ranges and ranges[-1][0] + ranges[-1][1] == offset and ranges[-1][1] + length <= MAX_READ:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+        else:
+            ranges.append((offset, length))
+    return ranges
+
+
+def extract_timestamp(line):
+    # Pull the phone timestamp out of a raw JSON line without a full parse.
+    match = _TIMESTAMP.search(line)
+    return int(match.group(1)) if match else None
+
+
+class SparseIndex:
+    """Block index over one append-only line file.
+
+    Every `stride` lines we record the block's byte range together with the
+    smallest and largest timestamp in it. Blocks carry min/max rather than a
+    single key so readings from several phones, which are not globally
+    ordered, are still found. A range query only reads the blocks whose
+    min/max overlap it, so its cost follows the result size, not the file size.
+    """
+
+    def __init__(self, writer, name, stride=STRIDE):
+        self.writer = writer
+        self.name = name
+        self.index_name = index_name(name)
+        self.stride = stride
+        self.entries = []
+        self._loading = None
+        self._reset_block(0)
+
+    def _reset_block(self, offset):
+        self.offset = offset
+        self._block_offset = offset
+        self._block_rows = 0
+        self._block_min = None
+        self._block_max = None
+
+    def load(self):
+        # Pick up where a previous run left off: read the saved entries, then
+        # rescan the unindexed tail of the data file. Runs before any writes,
+        # usually off the event loop, so entries found in the tail are
+        # appended to the index file directly rather than through the writer.
+        data_path = self.writer.root / self.name
+        index_path = self.writer.root / self.index_name
+        size = data_path.stat().st_size if data_path.exists() else 0
+
+        entries = []
+        if index_path.exists():
+            raw_size = index_path.stat().st_size
+            entries = [e for e in read_entries(index_path) if e[2] + e[3] <= size]
+            if len(entries) * ENTRY.size != raw_size:
+                # Entries that outlived their data (e.g. after a crash) are dropped.
+                index_path.write_bytes(b"".join(ENTRY.pack(*e) for e in entries))
+        self.entries = entries
+        self._reset_block(entries[-1][2] + entries[-1][3] if entries else 0)
+
+        if size > self.offset:
+            self._loading = []
+            try:
+                with open(data_path, "rb") as f:
+                    f.seek(self.offset)
+                    for line in f:
+                        self.observe(line)
+            finally:
+                found, self._loading = self._loading, None
+            if found:
+                index_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(index_path, "ab") as f:
+                    f.write(b"".join(found))
+
+    def observe(self, line):
+        timestamp = extract_timestamp(line)
+        if timestamp is not None:
+            if self._block_min is None or timestamp < self._block_min:
+                self._block_min = timestamp
+            if self._block_max is None or timestamp > self._block_max:
+                self._block_max = timestamp
+        self.offset += len(line)
+        self._block_rows += 1
+
+        if self._block_rows >= self.stride:
+            self._close_block()
+        return timestamp
+
+    def _close_block(self):
+        if self._block_min is not None:
+            entry = (self._block_min, self._block_max, self._block_offset, self.offset - self._block_offset)
+            self.entries.append(entry)
+            if self._loading is not None:
+                self._loading.append(ENTRY.pack(*entry))
+            else:
+                self.writer.write(self.index_name, ENTRY.pack(*entry))
+        self._reset_block(self.offset)
+
+    def ranges(self, start, end):
+        # Byte ranges (offset, length) that may hold readings in [start, end].
+        blocks = list(self.entries)
+        if self._block_min is not None:
+            blocks.append((self._block_min, self._block_max, self._block_offset, self.offset - self._block_offset))
+        return merge_ranges(blocks, start, end)
+
+    def seal(self, sealed):
+        # The data file is being sealed as `sealed`: finish its index under
+        # the matching name and start over for the new, empty file.
+        self._close_block()
+        self.writer.rotate(self.index_name, index_name(sealed), archive=False)
+        self.entries = []
+        self._reset_block(0)
+
+
+class TimeIndexes:
+    # One SparseIndex per data file, loaded on first use. Loading can mean
+    # scanning a whole file, so the server calls get() for a new file in an
+    # executor first; after that, get() and observe() are dict lookups.
+
+    def __init__(self, writer, stride=STRIDE):
+        self.writer = writer
+        self.stride = stride
+        self._indexes = {}
+        self._lock = threading.Lock()
+        writer.add_rotate_hook(self._rotated)
+
+    def get(self, name):
+        index = self._indexes.get(name)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(name)
+                if index is None:
+                    index = SparseIndex(self.writer, name, self.stride)
+                    index.load()
+                    self._indexes[name] = index  # only once fully loaded
+        return index
+
+    def observe(self, name, line):
+        return self.get(name).observe(line)
+
+    def forget(self, name):
+        # Drop the in-memory index of a file that is no longer written. Call
+        # once its data is on disk: get() reloads it, rescanning the tail.
+        self._indexes.pop(name, None)
+
+    def _rotated(self, name, sealed):
+        if PurePosixPath(name).parts[0] != "index":
+            self.get(name).seal(sealed)
+
+
+def sealed_sources(root, name, start, end):
+    # Sealed versions of data file `name` that may hold readings in
+    # [start, end], oldest first, as (path, ranges). Plain files are read by
+    # index ranges; gzipped ones (ranges None) have to be scanned, but their
+    # index still lets us skip files outside the time range. Blocking.
+    root = Path(root)
+    sources = []
+    for path in sealed_files((root / name).parent, PurePosixPath(name).name):
+        idx = index_path(root, path)
+        entries = read_entries(idx) if idx.exists() else None
+        if entries is not None and not merge_ranges(entries, start, end):
+            continue
+        if path.suffix == ".gz" or entries is None:
+            sources.append((path, None))
+        else:
+            sources.append((path, merge_ranges(entries, start, end)))
+    return sources
+
+
+def open_lines(path):
+    return gzip.open(path, "rb") if Path(path).suffix == ".gz" else open(path, "rb")
+
+
+def read_lines(f, start, end, limit=MAX_READ):
+    # Next lines of an open file with a timestamp in [start, end], reading
+    # about `limit` bytes. Returns (lines, done). Blocking.
+    lines = []
+    read = 0
+    for line in f:
+        read += len(line)
+        timestamp = extract_timestamp(line)
+        if timestamp is not None and start <= timestamp <= end:
+            lines.append(line.rstrip(b"\n"))
+        if read >= limit:
+            return lines, False
+    return lines, True
+
+
+def read_range(path, offset, length, start, end):
+    # Lines in one byte range of `path` whose timestamp is in [start, end].
+    # Blocking; run it off the event loop.
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    # The newest block may still be partly in the writer's queue.
+    data = data[:data.rfind(b"\n") + 1]
+
+    lines = []
+    for line in data.splitlines():
+        timestamp = extract_timestamp(line)
+        if timestamp is not None and start <= timestamp <= end:
+            lines.append(line)
+    return lines
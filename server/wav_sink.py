@@ -0,0 +1,120 @@
+import re
+import struct
+import time
+from pathlib import Path
+
+HEADER_SIZE = 44
+PATCH_INTERVAL = 1.0  # seconds between RIFF header refreshes
+MAX_BYTES = 512 * 1024 * 1024  # roll over well before the 4 GiB RIFF limit
+
+
+class WavSink:
+    """Streaming WAV writer for raw PCM chunks.
+
+    Each chunk is appended to the open file as-is; the RIFF and data sizes in
+    the header are patched in place every `patch_interval` seconds and on
+    close, so the file is playable while it is still growing and is never
+    rewritten. A sink writes numbered files (`audio_0001.wav`, ...) and rolls
+    over to the next number once `max_bytes` of audio have been written, or
+    once a file has been open for `max_seconds` (0 = no limit). `on_sealed`
+    is called with the path of every finished file.
+    """
+
+    def __init__(self, root, prefix="audio", channels=1, sample_width=2,
+                 frame_rate=48000, max_bytes=MAX_BYTES, patch_interval=PATCH_INTERVAL,
+                 max_seconds=0, on_sealed=None):
+        self.root = Path(root)
+        self.prefix = prefix
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frame_rate = frame_rate
+        self.block_align = channels * sample_width
+        self.max_bytes = max_bytes - max_bytes % self.block_align
+        self.patch_interval = patch_interval
+        self.max_seconds = max_seconds
+        self.on_sealed = on_sealed
+
+        self.path = None
+        self._file = None
+        self._data_bytes = 0
+        self._patched_bytes = 0
+        self._patched_at = 0.0
+        self._opened_at = 0.0
+        self._carry = b""
+
+    def _next_path(self):
+        pattern = re.compile(rf"{re.escape(self.prefix)}_(\d+)\.wav$")
+        numbers = [
+            int(m.group(1))
+            for m in (pattern.match(p.name) for p in self.root.glob(f"{self.prefix}_*.wav"))
+            if m
+        ]
+        return self.root / f"{self.prefix}_{max(numbers, default=0) + 1:04d}.wav"
+
+    def _header(self):
+        byte_rate = self.frame_rate * self.block_align
+        return struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF", 36 + self._data_bytes, b"WAVE",
+            b"fmt ", 16, 1, self.channels, self.frame_rate, byte_rate,
+            self.block_align, self.sample_width * 8,
+            b"data", self._data_bytes,
+        )
+
+    def _open(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.path = self._next_path()
+        self._file = open(self.path, "wb")
+        self._data_bytes = 0
+        self._file.write(self._header())
+        self._patched_bytes = 0
+        self._patched_at = self._opened_at = time.monotonic()
+
+    def _patch_header(self):
+        if self._patched_bytes == self._data_bytes:
+            return
+        self._file.seek(4)
+        self._file.write(struct.pack("<I", 36 + self._data_bytes))
+        self._file.seek(40)
+        self._file.write(struct.pack("<I", self._data_bytes))
+        self._file.seek(0, 2)
+        self._file.flush()
+        self._patched_bytes = self._data_bytes
+        self._patched_at = time.monotonic()
+
+    def _seal(self):
+        self._patch_header()
+        self._file.close()
+        self._file = None
+        if self.on_sealed is not None:
+            self.on_sealed(self.path)
+
+    def write(self, pcm):
+        # Only whole frames go to disk; a split frame waits for the next chunk.
+        if self._carry:
+            pcm = self._carry + pcm
+        view = memoryview(pcm)
+        usable = len(view) - len(view) % self.block_align
+        self._carry = bytes(view[usable:])
+        view = view[:usable]
+
+        if self._file is not None and self.max_seconds and time.monotonic() - self._opened_at >= self.max_seconds:
+            self._seal()
+        while view:
+            if self._file is None:
+                self._open()
+            room = self.max_bytes - self._data_bytes
+            if room == 0:
+                self._seal()
+                continue
+            part = view[:room]
+            self._file.write(part)
+            self._data_bytes += len(part)
+            view = view[len(part):]
+
+        if self._file is not None and time.monotonic() - self._patched_at >= self.patch_interval:
+            self._patch_header()
+
+    def close(self):
+        if self._file is not None:
+            self._seal()
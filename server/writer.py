@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import metrics
+from rotation import sealed_name
+
+FLUSH_INTERVAL = 0.5  # seconds between time-based flushes
+FLUSH_BYTES = 256 * 1024  # flush early once this much is queued
+LAG_WARNING = 5.0  # seconds behind before we start complaining
+
+log = logging.getLogger(__name__)
+
+
+class _Seal:
+    # Queued among a file's chunks: everything before it goes to the current
+    # file, which is then closed and renamed to `sealed`.
+
+    def __init__(self, sealed, archive):
+        self.sealed = sealed
+        self.archive = archive
+
+
+class BufferedWriter:
+    """Append-only writer that batches small writes per file.
+
+    Writes are queued in memory on the event loop and flushed by a background
+    task, either every `flush_interval` seconds or as soon as `flush_bytes`
+    are pending. The actual disk I/O runs on a single dedicated thread, which
+    also owns every file handle, so handles stay open between flushes and
+    nothing blocks the loop.
+
+    With a `rotation` policy (see rotation.py), `rotate_if_due()` seals a file
+    that grew too large or old: the rename happens on the I/O thread in queue
+    order, so writes before and after it land in the old and new file with no
+    pause in ingest.
+    """
+
+    def __init__(self, root, flush_interval=FLUSH_INTERVAL, flush_bytes=FLUSH_BYTES):
+        self.root = Path(root)
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+
+        self._pending = defaultdict(list)
+        self._pending_records = 0
+        self._pending_bytes = 0
+        self._pending_since = None
+        self._pending_stamps = defaultdict(list)
+
+        # Batch currently being written by the I/O thread.
+        self._inflight_records = 0
+        self._inflight_bytes = 0
+        self._inflight_since = None
+
+        self._release = set()
+        self._flush_hooks = []
+
+        self.rotation = None
+        self._sizes = {}  # name -> (bytes written or queued, monotonic start), for rotation
+        self._rotate_hooks = []
+
+        self._handles = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+        self._flush_lock = None
+        self._wakeup = None
+        self._task = None
+
+        self.flushed_records = 0
+        self.flushed_bytes = 0
+        self.last_flush_seconds = 0.0
+        # Called as on_persisted(name, stamps) once data written with `stamps`
+        # (phone timestamps, in ms) is on disk.
+        self.on_persisted = None
+
+    def write(self, name, data, stamps=None):
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        self._pending[name].append(data)
+        if name in self._sizes:
+            size, started = self._sizes[name]
+            self._sizes[name] = (size + len(data), started)
+        self._pending_records += 1
+        self._pending_bytes += len(data)
+        if stamps is not None:
+            self._pending_stamps[name].extend(stamps)
+        if self._pending_bytes >= self.flush_bytes and self._wakeup is not None:
+            self._wakeup.set()
+
+    def release(self, name):
+        # Close the handle for `name` once everything queued for it is written.
+        self._release.add(name)
+
+    def rotate_if_due(self, name, incoming=0):
+        # Seal `name` if appending `incoming` more bytes would break the
+        # rotation policy. Returns the sealed name, or None.
+        if self.rotation is None:
+            return None
+        state = self._sizes.get(name)
+        if state is None:
+            path = self.root / name
+            state = self._sizes[name] = (path.stat().st_size if path.exists() else 0, time.monotonic())
+        if not self.rotation.due(name, state[0], state[1], incoming):
+            return None
+        return self.rotate(name)
+
+    def rotate(self, name, sealed=None, archive=True):
+        # Seal `name` as `sealed` once what is queued for it is written; later
+        # writes start a new file. Rotate hooks run first, on the loop.
+        sealed = sealed or sealed_name(name)
+        for hook in self._rotate_hooks:
+            hook(name, sealed)
+        self._pending[name].append(_Seal(sealed, archive))
+        self._sizes[name] = (0, time.monotonic())
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        return sealed
+
+    def add_rotate_hook(self, hook):
+        # hook(name, sealed) runs right before `name` is sealed, so e.g. the
+        # time index can seal its own file for it in step.
+        self._rotate_hooks.append(hook)
+
+    def add_flush_hook(self, hook):
+        # Hooks run on the loop right before each flush, so components that
+        # batch on their own (e.g. columnar storage) can hand over their data.
+        self._flush_hooks.append(hook)
+
+    def remove_flush_hook(self, hook):
+        self._flush_hooks.remove(hook)
+
+    def lag(self):
+        # How far behind the disk is: everything queued or being written.
+        oldest = [t for t in (self._pending_since, self._inflight_since) if t is not None]
+        return {
+            "records": self._pending_records + self._inflight_records,
+            "bytes": self._pending_bytes + self._inflight_bytes,
+            "seconds": time.monotonic() - min(oldest) if oldest else 0.0,
+        }
+
+    async def start(self):
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close_handles)
+        self._executor.shutdown(wait=True)
+
+    async def flush(self):
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            for hook in self._flush_hooks:
+                hook()
+            if not self._pending and not self._release:
+                return
+
+            batch = self._pending
+            self._pending = defaultdict(list)
+            release, self._release = self._release, set()
+            stamps, self._pending_stamps = self._pending_stamps, defaultdict(list)
+            self._inflight_records, self._pending_records = self._pending_records, 0
+            self._inflight_bytes, self._pending_bytes = self._pending_bytes, 0
+            self._inflight_since, self._pending_since = self._pending_since, None
+
+            started = time.monotonic()
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(self._executor, self._write_batch, batch, release)
+                self.flushed_records += self._inflight_records
+                self.flushed_bytes += self._inflight_bytes
+                if self.on_persisted is not None:
+                    for name, name_stamps in stamps.items():
+                        self.on_persisted(name, name_stamps)
+            finally:
+                self.last_flush_seconds = time.monotonic() - started
+                metrics.WRITE_SECONDS.observe(self.last_flush_seconds, "writer")
+                self._inflight_records = 0
+                self._inflight_bytes = 0
+                self._inflight_since = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                log.error("[writer] Error: %s", e)
+
+            lag = self.lag()
+            if lag["seconds"] > LAG_WARNING:
+                log.warning(
+                    "[writer] Falling behind: %d records (%d bytes) pending for %.1fs",
+                    lag["records"], lag["bytes"], lag["seconds"],
+                )
+
+    # Everything below runs on the I/O thread only.
+
+    def _handle(self, name):
+        f = self._handles.get(name)
+        if f is None:
+            path = self.root / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            f = self._handles[name] = open(path, "ab")
+        return f
+
+    def _write_batch(self, batch, release):
+        for name, chunks in batch.items():
+            start = 0
+            for i, chunk in enumerate(chunks):
+                if isinstance(chunk, _Seal):
+                    self._append(name, chunks[start:i])
+                    self._seal(name, chunk)
+                    start = i + 1
+            self._append(name, chunks[start:])
+        for name in release:
+            f = self._handles.pop(name, None)
+            if f is not None:
+                f.close()
+
+    def _append(self, name, chunks):
+        if chunks:
+            f = self._handle(name)
+            f.write(b"".join(chunks))
+            f.flush()
+
+    def _seal(self, name, seal):
+        f = self._handles.pop(name, None)
+        if f is not None:
+            f.close()
+        path = self.root / name
+        if not path.exists():
+            return
+        sealed = self.root / seal.sealed
+        path.replace(sealed)
+        if seal.archive and self.rotation is not None:
+            self.rotation.sealed(sealed)
+
+    def _close_handles(self):
+        for f in self._handles.values():
+            f.close()
+        self._handles.clear()